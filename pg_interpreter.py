@@ -3,10 +3,32 @@
 import pygame
 import sys
 import re
+import math
 import time
 import os
 import tkinter as tk
 import traceback
+import argparse
+import hashlib
+import importlib.util
+import bisect
+import queue
+import threading
+import heapq
+import struct
+import zlib
+import json
+import subprocess
+import tempfile
+import types
+import mmap
+from array import array
+from collections import deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 COLORS = {
     'red': (255, 0, 0), 'green': (0, 255, 0), 'blue': (0, 0, 255), 'brown': (139, 69, 19),
@@ -20,18 +42,728 @@ KEY_MAP = {
     'space': pygame.K_SPACE, 'a': pygame.K_a, 'd': pygame.K_d, 'w': pygame.K_w, 's': pygame.K_s, 'p': pygame.K_p
 }
 
+# bump when the generated code changes so stale __pgcache__ modules get rebuilt
+TRANSPILE_VERSION = 7
+
+class Body:
+    # float position/size with an integer rect derived from it for drawing and collision tests.
+    # s['vx'], s.get('enemy') etc. still work so older dict-style code keeps running.
+    __slots__ = ('x', 'y', 'w', 'h', 'color', 'rect')
+
+    def __init__(self, x, y, w, h, color):
+        self.x = float(x)
+        self.y = float(y)
+        self.w = float(w)
+        self.h = float(h)
+        self.color = color
+        self.rect = pygame.Rect(0, 0, int(self.w), int(self.h))
+        self.sync_rect()
+
+    def sync_rect(self):
+        # floor both ways: pygame.Rect() truncates floats but assigning topleft rounds them, and
+        # mixing the two moved a sprite's rect by a pixel the first time it synced
+        self.rect.topleft = (math.floor(self.x), math.floor(self.y))
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'rect':
+            self.x, self.y, self.w, self.h = float(value[0]), float(value[1]), float(value[2]), float(value[3])
+            self.rect = pygame.Rect(0, 0, int(self.w), int(self.h))
+            self.sync_rect()
+            return
+        try:
+            setattr(self, key, value)
+        except AttributeError:
+            raise KeyError(key)
+        if key in ('x', 'y'):
+            self.sync_rect()
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+class Platform(Body):
+    __slots__ = ()
+
+class Sprite(Body):
+    __slots__ = ('vx', 'vy', 'px', 'py', 'jump_power', 'gravity', 'remove', 'collectable', 'enemy', 'contacts', 'on_ground', 'frozen')
+
+    def __init__(self, x, y, w, h, color, jump_power):
+        Body.__init__(self, x, y, w, h, color)
+        self.vx = 0.0
+        self.vy = 0.0
+        self.px = self.x
+        self.py = self.y
+        self.jump_power = jump_power
+        self.gravity = True
+        self.remove = False
+        self.collectable = False
+        self.enemy = False
+        self.contacts = []
+        self.on_ground = False
+        self.frozen = 0
+
+class PlatformIndex:
+    # platforms sorted by left edge so a horizontal range query is a bisect instead of a full scan.
+    # platforms don't move, so the index is only rebuilt after one is created.
+    def __init__(self):
+        self.lefts = []
+        self.items = []
+        self.max_width = 0
+        self.dirty = False
+
+    def rebuild(self, platforms):
+        order = sorted(range(len(platforms)), key=lambda i: platforms[i].rect.left)
+        self.items = [(i, platforms[i]) for i in order]
+        self.lefts = [p.rect.left for i, p in self.items]
+        self.max_width = max((p.rect.width for p in platforms), default=0)
+        self.dirty = False
+
+    def query(self, x0, x1):
+        # platforms overlapping [x0, x1), in creation order so overlaps draw the same as before
+        lo = bisect.bisect_left(self.lefts, x0 - self.max_width)
+        hi = bisect.bisect_left(self.lefts, x1)
+        found = [(i, p) for i, p in self.items[lo:hi] if p.rect.right > x0]
+        found.sort(key=lambda item: item[0])
+        return [p for i, p in found]
+
+class SpriteGrid:
+    # sprites bucketed into fixed-width horizontal cells; a sprite only changes buckets
+    # when it crosses a cell edge, so keeping the grid current is cheap every frame
+    def __init__(self, cell=256):
+        self.cell = cell
+        self.cells = {}
+        self.spans = {}
+        self.order = {}
+        self.count = 0
+
+    def place(self, name, s):
+        c0 = s.rect.left // self.cell
+        c1 = (s.rect.right - 1) // self.cell
+        span = self.spans.get(name)
+        if span == (c0, c1):
+            return
+        if span:
+            self.discard(name)
+        for c in range(c0, c1 + 1):
+            self.cells.setdefault(c, {})[name] = s
+        self.spans[name] = (c0, c1)
+        if name not in self.order:
+            self.order[name] = self.count
+            self.count += 1
+
+    def discard(self, name):
+        span = self.spans.pop(name, None)
+        if not span:
+            return
+        for c in range(span[0], span[1] + 1):
+            bucket = self.cells.get(c)
+            if bucket is not None:
+                bucket.pop(name, None)
+                if not bucket:
+                    del self.cells[c]
+
+    def query(self, x0, x1):
+        # (name, sprite) pairs overlapping [x0, x1), in creation order
+        found = {}
+        for c in range(x0 // self.cell, (x1 - 1) // self.cell + 1):
+            bucket = self.cells.get(c)
+            if bucket:
+                found.update(bucket)
+        hits = [(name, s) for name, s in found.items() if s.rect.right > x0 and s.rect.left < x1]
+        hits.sort(key=lambda item: self.order[item[0]])
+        return hits
+
+class ParticleSystem:
+    # fixed-capacity arrays, live particles packed at the front. Integration, expiry and
+    # drawing are whole-array numpy operations; there is no python object per particle.
+    def __init__(self, capacity=4096, size=2):
+        self.capacity = capacity
+        self.size = size
+        self.count = 0
+        self.pos = np.zeros((capacity, 2), np.float32)
+        self.vel = np.zeros((capacity, 2), np.float32)
+        self.life = np.zeros(capacity, np.float32)
+        self.color = np.zeros((capacity, 3), np.uint8)
+        self.rng = np.random.default_rng()
+
+    def emit(self, n, x, y, color, speed, frames):
+        n = min(n, self.capacity - self.count)
+        if n <= 0:
+            return
+        a, b = self.count, self.count + n
+        angle = self.rng.uniform(0, 2 * math.pi, n)
+        mag = self.rng.uniform(0.3, 1.0, n) * speed
+        self.pos[a:b] = (x, y)
+        self.vel[a:b, 0] = np.cos(angle) * mag
+        self.vel[a:b, 1] = np.sin(angle) * mag
+        self.life[a:b] = self.rng.uniform(0.5, 1.0, n) * frames
+        self.color[a:b] = color
+        self.count = b
+
+    def update(self, gravity):
+        c = self.count
+        if not c:
+            return
+        self.vel[:c, 1] += gravity
+        self.pos[:c] += self.vel[:c]
+        self.life[:c] -= 1
+        alive = self.life[:c] > 0
+        k = int(alive.sum())
+        if k < c:
+            for arr in (self.pos, self.vel, self.life, self.color):
+                arr[:k] = arr[:c][alive]
+            self.count = k
+
+    def draw(self, surface, cam_x, scale=1):
+        c = self.count
+        if not c:
+            return
+        w, h = surface.get_size()
+        xs = ((self.pos[:c, 0] - cam_x) // scale).astype(np.int32)
+        ys = (self.pos[:c, 1] // scale).astype(np.int32)
+        size = self.size
+        visible = (xs >= 0) & (ys >= 0) & (xs <= w - size) & (ys <= h - size)
+        xs, ys, cols = xs[visible], ys[visible], self.color[:c][visible]
+        pixels = pygame.surfarray.pixels3d(surface)
+        for dx in range(size):
+            for dy in range(size):
+                pixels[xs + dx, ys + dy] = cols
+        del pixels
+
+class FrameCapture:
+    # frames are copied on the game thread and encoded on a worker thread. The queue between
+    # them is bounded and a full queue drops the frame, so encoding can never stall the game.
+    # Pillow only writes a GIF once it has every frame, so GIFs stop at max_gif_frames to bound memory.
+    def __init__(self, path, every=1, fps=60, max_queue=64, max_gif_frames=600):
+        self.path = path
+        self.every = max(1, every)
+        self.fps = fps or 60
+        self.queue = queue.Queue(max_queue)
+        self.offered = 0
+        self.saved = 0
+        self.dropped = 0
+        self.max_gif_frames = max_gif_frames
+        self.gif = path.lower().endswith('.gif')
+        if self.gif:
+            try:
+                from PIL import Image
+                self.Image = Image
+            except ImportError:
+                print("GIF capture needs Pillow: pip install pillow - writing PNG frames instead")
+                self.gif = False
+                self.path = os.path.splitext(path)[0] + '_frames'
+        if self.gif:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def offer(self, surface):
+        self.offered += 1
+        if (self.offered - 1) % self.every:
+            return
+        if self.queue.full():
+            self.dropped += 1
+            return
+        self.queue.put_nowait((surface.get_size(), pygame.image.tobytes(surface, 'RGB')))
+
+    def work(self):
+        frames = []
+        warned = False
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            size, data = item
+            if self.gif and len(frames) >= self.max_gif_frames:
+                if not warned:
+                    print(f"GIF capture stops at {self.max_gif_frames} frames; record to a folder of PNG frames for longer runs")
+                    warned = True
+                self.dropped += 1
+                continue
+            if self.gif:
+                frames.append(self.Image.frombytes('RGB', size, data).quantize())
+            else:
+                frame = pygame.image.frombuffer(data, size, 'RGB')
+                pygame.image.save(frame, os.path.join(self.path, 'frame_%05d.png' % self.saved))
+            self.saved += 1
+        if frames:
+            frames[0].save(self.path, save_all=True, append_images=frames[1:],
+                           duration=int(1000 * self.every / self.fps), loop=0)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        print(f"Captured {self.saved} frames to {self.path} ({self.dropped} dropped)")
+
+class SoundBank:
+    # every file is decoded once into a Sound kept under its key. Playback uses a fixed pool
+    # of channels; when all are busy the voice that started longest ago is cut off.
+    def __init__(self, channels=8):
+        if not pygame.mixer.get_init():
+            pygame.mixer.init(44100, -16, 2, 512)
+        self.set_channels(channels)
+        self.sounds = {}
+        self.files = {}
+
+    def set_channels(self, channels):
+        pygame.mixer.set_num_channels(channels)
+        self.channels = [pygame.mixer.Channel(i) for i in range(channels)]
+        self.started = [0] * channels
+
+    def load(self, key, path):
+        path = os.path.abspath(path)
+        if path not in self.files:
+            self.files[path] = pygame.mixer.Sound(path)
+        self.sounds[key] = self.files[path]
+
+    def play(self, key):
+        sound = self.sounds.get(key)
+        if sound is None:
+            return
+        i = next((i for i, ch in enumerate(self.channels) if not ch.get_busy()), None)
+        if i is None:
+            i = min(range(len(self.channels)), key=self.started.__getitem__)
+        self.channels[i].play(sound)
+        self.started[i] = pygame.time.get_ticks()
+
+class Scheduler:
+    # timers in a heap keyed on due time (game milliseconds, which stand still during 'wait'),
+    # so a frame only pops the ones that are due instead of checking every timer
+    def __init__(self):
+        self.heap = []
+        self.now = 0
+        self.seq = 0
+
+    def add(self, delay, fn, interval=0):
+        # fn(game, keys); a non-zero interval re-arms the timer every interval ms
+        heapq.heappush(self.heap, (self.now + delay, self.seq, fn, interval))
+        self.seq += 1
+
+    def advance(self, dt, game, keys):
+        self.now += dt
+        while self.heap and self.heap[0][0] <= self.now:
+            due, _, fn, interval = heapq.heappop(self.heap)
+            if interval:
+                heapq.heappush(self.heap, (due + interval, self.seq, fn, interval))
+                self.seq += 1
+            fn(game, keys)
+
+def thaw(sprite):
+    return lambda game, keys: setattr(sprite, 'frozen', sprite.frozen - 1)
+
+class QualityGovernor:
+    # watches how long each frame's work takes and steps quality down while frames run over
+    # 1/fps, then back up once there is plenty of headroom. each level keeps what the one before
+    # it turned off. a level that had to be left again soon after coming back waits twice as
+    # long before the next try, so it doesn't flicker between two levels.
+    LEVELS = [
+        ("full quality", dict(particle_density=1.0, draw_eyes=True, active_radius=None, scale=1)),
+        ("half the particles", dict(particle_density=0.5, draw_eyes=True, active_radius=None, scale=1)),
+        ("a quarter of the particles, no eyes", dict(particle_density=0.25, draw_eyes=False, active_radius=None, scale=1)),
+        ("sprites a screen away from the view wait", dict(particle_density=0.25, draw_eyes=False, active_radius=1.0, scale=1)),
+        ("half resolution", dict(particle_density=0.25, draw_eyes=False, active_radius=1.0, scale=2)),
+    ]
+
+    def __init__(self, fps, window=30, calm=120):
+        self.budget = 1.0 / fps
+        self.window = window
+        self.calm = calm
+        self.level = 0
+        self.times = deque(maxlen=calm)
+        self.raised_at = None
+        self.frames = 0
+
+    def frame(self, game, seconds):
+        # seconds: time the frame took before waiting for the clock
+        self.frames += 1
+        self.times.append(seconds)
+        recent = sum(list(self.times)[-self.window:]) / min(len(self.times), self.window)
+        if len(self.times) >= self.window and recent > self.budget and self.level < len(self.LEVELS) - 1:
+            if self.raised_at is not None and self.frames - self.raised_at < 2 * self.calm:
+                self.times = deque(maxlen=self.times.maxlen * 2)
+            self.set(game, self.level + 1, f"{recent * 1000:.1f} ms per frame, budget {self.budget * 1000:.1f} ms")
+        elif len(self.times) == self.times.maxlen and sum(self.times) / len(self.times) < self.budget / 2 and self.level > 0:
+            self.raised_at = self.frames
+            self.set(game, self.level - 1, f"{sum(self.times) / len(self.times) * 1000:.1f} ms per frame")
+
+    def set(self, game, level, reason=""):
+        self.level = level
+        self.times.clear()
+        name, settings = self.LEVELS[level]
+        game.apply_quality(settings)
+        print(f"quality {level}: {name}" + (f" ({reason})" if reason else ""))
+
+# snapshot layout, little-endian:
+#   head, then per sprite: name + record, then platform records (full snapshots only),
+#   eye sprite names, and the message if there is one
+SNAP_HEAD = struct.Struct('<4sddd3BiIIB')
+SNAP_SPRITE = struct.Struct('<H9d3BB')
+SNAP_PLATFORM = struct.Struct('<4d3B')
+SNAP_MESSAGE = struct.Struct('<3d3B')
+SNAP_NO_ALIAS = 0xFFFF
+
+def pack_str(s):
+    b = s.encode('utf-8')
+    return struct.pack('<H', len(b)) + b
+
+def unpack_str(data, off):
+    n, = struct.unpack_from('<H', data, off)
+    return data[off + 2:off + 2 + n].decode('utf-8'), off + 2 + n
+
+def xor_bytes(a, b):
+    n = max(len(a), len(b))
+    return (int.from_bytes(a, 'little') ^ int.from_bytes(b, 'little')).to_bytes(n, 'little')
+
+class RewindBuffer:
+    # the newest snapshot is kept whole; every older one is stored as zlib(xor(newer, older)),
+    # which is a handful of bytes when little changed between frames
+    def __init__(self, frames=600):
+        self.deltas = deque(maxlen=frames)
+        self.latest = None
+
+    def push(self, snap):
+        if self.latest is not None:
+            self.deltas.append(struct.pack('<I', len(self.latest)) + zlib.compress(xor_bytes(snap, self.latest), 1))
+        self.latest = snap
+
+    def pop(self):
+        # step one frame back and return that snapshot (the oldest one stays put)
+        if self.deltas:
+            delta = self.deltas.pop()
+            n, = struct.unpack_from('<I', delta)
+            self.latest = xor_bytes(self.latest, zlib.decompress(delta[4:]))[:n]
+        return self.latest
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def nbytes(self):
+        return sum(len(d) for d in self.deltas) + len(self.latest or b'')
+
+# level file (.pgl) layout, little-endian, each array starting on an 8-byte boundary:
+#   head, platform rects (x, y, w, h doubles, creation order), platform rect lefts (int32) and creation
+#   indices (uint32) sorted by left edge, platform colors (3 bytes each), sprite rects, sprite jump powers,
+#   sprite colors, sprite flags (1 gravity, 2 collectable, 4 enemy), sprite name end offsets (uint32), names
+LEVEL_HEAD = struct.Struct('<4sIIIi')
+
+def level_section(data):
+    if isinstance(data, array):
+        if sys.byteorder != 'little':
+            data.byteswap()
+        data = data.tobytes()
+    return data + bytes(-len(data) % 8)
+
+SCRIPT_COMMANDS = ('create', 'background', 'gravity', 'move', 'stop', 'jump', 'text', 'wait', 'quit', 'restart',
+                   'emit', 'sound', 'play', 'particles', 'draw', 'set', 'reverse', 'level')
+
+def is_number(word):
+    try:
+        float(word)
+        return True
+    except ValueError:
+        return False
+
+def check_line(raw):
+    # static check of one script line for the editor, following what parse_program, exec_cmd and eval_cond accept
+    # -> (sprite names it creates, [(name, start, end)] sprite names it uses, [(start, end, message)] problems)
+    # columns index into raw so the editor can underline them
+    defines, uses, errors = [], [], []
+    line = raw.strip()
+    if not line or line.startswith('#') or line == 'every frame:':
+        return defines, uses, errors
+
+    def words_in(a, b):
+        # (word, start, end) for raw[a:b]; ',' and ':' split words too
+        return [(m.group(), a + m.start(), a + m.end()) for m in re.finditer(r'[^\s:,]+', raw[a:b])]
+
+    def error(w, message):
+        errors.append((w[0][1], w[-1][2], message))
+
+    def cond(w):
+        toks = [t[0].lower() for t in w]
+        if not toks:
+            return
+        if toks[0] == 'not':
+            cond(w[1:])
+        elif 'or' in toks:
+            i = toks.index('or')
+            cond(w[:i])
+            cond(w[i + 1:])
+        elif toks[0] == 'key':
+            if len(toks) != 2 or toks[1] not in KEY_MAP:
+                error(w, f"unknown key, use one of: {', '.join(KEY_MAP)}")
+        elif len(toks) == 3 and toks[1] == 'touches':
+            # eval_cond lowercases the whole condition
+            uses.extend((toks[i], w[i][1], w[i][2]) for i in (0, 2))
+        elif len(toks) == 4 and toks[1] in ('x', 'y') and toks[2] in ('<', '>', '=') and re.match(r'^\d+(?:\.\d+)?$', toks[3]):
+            uses.append((toks[0], w[0][1], w[0][2]))
+        else:
+            error(w, "not a condition: key K, A touches B, or NAME x|y >|<|= N")
+
+    def command(w):
+        toks = [t[0].lower() for t in w]
+        cmd = toks[0]
+        n = len(toks)
+        if cmd == 'if':
+            error(w, "an if with the command on the same line never runs; put the command on the next line, indented")
+        elif cmd not in SCRIPT_COMMANDS:
+            error(w[:1], f"unknown command '{w[0][0]}'")
+        elif cmd == 'create':
+            at = toks.index('at') if 'at' in toks else -1
+            if n < 2 or at == 1:
+                error(w, "create needs a name: create NAME at X,Y")
+            elif at < 0 or at + 2 >= n or not (is_number(toks[at + 1]) and is_number(toks[at + 2])):
+                error(w, "create needs a position: create NAME at X,Y")
+            elif toks[1] != 'platform':
+                defines.append(w[1][0])
+            for i, t in enumerate(toks):
+                if t in ('size', 'width', 'height') and (i + 1 >= n or not is_number(toks[i + 1])):
+                    error(w[i:i + 2], f"{t} needs a number")
+        elif cmd == 'background':
+            if n < 2:
+                error(w, "background COLOR")
+        elif cmd == 'gravity':
+            if toks[1:] not in (['on'], ['off']):
+                error(w, "gravity on or gravity off")
+        elif cmd == 'jump' and n > 1 and toks[1] == 'power':
+            if n != 3 or not is_number(toks[2]):
+                error(w, "jump power N")
+        elif cmd in ('jump', 'stop'):
+            if n != 2:
+                error(w, f"{cmd} NAME")
+            else:
+                uses.append(w[1])
+        elif cmd == 'move':
+            if n < 3 or toks[1] not in ('left', 'right', 'up', 'down'):
+                error(w, "move left|right|up|down NAME [speed N]")
+            else:
+                uses.append(w[2])
+                if n > 3 and (n != 5 or toks[3] != 'speed' or not is_number(toks[4])):
+                    error(w[3:], "speed N")
+        elif cmd == 'text':
+            if not re.search(r'"[^"]*"\s*at\s+-?[\d\.]+\s*,\s*-?[\d\.]+', raw[w[0][1]:w[-1][2]]):
+                error(w, 'text "MESSAGE" at X,Y')
+        elif cmd == 'wait':
+            rest = [t for t in w[2:] if t[0].lower() not in ('second', 'seconds')]
+            if n < 2 or not is_number(toks[1]) or len(rest) > 1:
+                error(w, "wait N [seconds] [NAME]")
+            elif rest:
+                uses.append(rest[0])
+        elif cmd == 'emit':
+            if n < 4 or not is_number(toks[1]) or toks[2] != 'at':
+                error(w, "emit N at X,Y or emit N at NAME")
+            elif not is_number(toks[3]):
+                uses.append(w[3])
+        elif cmd == 'sound':
+            if not (n >= 4 and toks[1] == 'load') and not (n == 3 and toks[1] == 'channels' and is_number(toks[2])):
+                error(w, 'sound load NAME "file.wav" or sound channels N')
+        elif cmd == 'play':
+            if n != 2:
+                error(w, "play NAME")
+        elif cmd == 'particles':
+            if n != 3 or toks[1] not in ('max', 'size') or not is_number(toks[2]):
+                error(w, "particles max N or particles size N")
+        elif cmd == 'draw':
+            if n != 4 or toks[1:3] != ['eyes', 'on']:
+                error(w, "draw eyes on NAME")
+            else:
+                uses.append(w[3])
+        elif cmd == 'set':
+            if n < 4 or toks[1] not in ('x', 'y') or not is_number(toks[-1]):
+                error(w, "set x|y NAME to N")
+            else:
+                uses.append(w[2])
+        elif cmd == 'reverse':
+            if n != 3 or toks[1] not in ('x', 'y'):
+                error(w, "reverse x|y NAME")
+            else:
+                uses.append(w[2])
+        elif cmd == 'level':
+            if n < 2:
+                error(w, 'level "file.pgl"')
+            else:
+                # the level file's sprite names aren't known here
+                defines.append(None)
+
+    def commands(a):
+        for m in re.finditer(r'[^;]+', raw[a:]):
+            w = words_in(a + m.start(), a + m.end())
+            if w:
+                command(w)
+
+    start = len(raw) - len(raw.lstrip())
+    head = line.split()[0].lower()
+    if head == 'if' and line.endswith(':'):
+        cond(words_in(start + 2, start + len(line) - 1))
+    elif head in ('on', 'when', 'every', 'after'):
+        colon = raw.find(':', start)
+        header = words_in(start, colon if colon != -1 else len(raw))
+        if head == 'on':
+            m = re.match(r'^on\s+(key|release)\s+(\w+)\s*:', line, re.IGNORECASE)
+        elif head == 'when':
+            m = re.match(r'^when\s+(\w+)\s+touches\s+(\w+)\s*:', line, re.IGNORECASE)
+        else:
+            m = re.match(r'^\w+\s+(\d+(?:\.\d+)?)\s*(?:seconds?)?\s*:', line, re.IGNORECASE)
+        if not m:
+            error(header, {'on': "on key K: or on release K:", 'when': "when A touches B:"}.get(head, f"{head} N seconds:"))
+        elif head == 'on' and m.group(2).lower() not in KEY_MAP:
+            error(header[2:3], f"unknown key, use one of: {', '.join(KEY_MAP)}")
+        elif head == 'when':
+            uses.append(header[1])
+            if header[3][0].lower() != 'platform':
+                # 'when A touches platform:' fires on any platform
+                uses.append(header[3])
+        if colon != -1:
+            commands(colon + 1)
+    else:
+        commands(start)
+    return defines, uses, errors
+
+# fonts outlive games: the editor preview makes a new PGGame on every edit, and Font(None, size)
+# reloads the default font file each time. cleared before pygame.quit(), which frees them.
+FONTS = {}
+
+def get_font(size):
+    font = FONTS.get(size)
+    if font is None:
+        font = FONTS[size] = pygame.font.Font(None, size)
+    return font
+
+class WorkerPool:
+    # 'pg_interpreter.py --worker' processes started ahead of time: python, pygame and the fonts are
+    # already loaded when a game is handed over, so it only has to open its window and run.
+    # a worker runs one game and exits; the pool starts a replacement straight away.
+    def __init__(self, size=1):
+        self.size = size
+        self.idle = deque()
+        self.fill()
+
+    def fill(self):
+        self.idle = deque(w for w in self.idle if w.poll() is None)
+        while len(self.idle) < self.size:
+            self.idle.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker'],
+                                              stdin=subprocess.PIPE, text=True))
+
+    def run(self, filename=None, source=None, script_dir=None, **options):
+        # options go to PGGame(), e.g. title, render_scale, compiled; script_dir as in PGGame.run
+        self.fill()
+        worker = self.idle.popleft()
+        worker.stdin.write(json.dumps({'filename': filename, 'source': source, 'script_dir': script_dir,
+                                       'options': options}) + '\n')
+        worker.stdin.close()
+        self.fill()
+        return worker
+
+    def close(self):
+        # idle workers exit when their stdin closes
+        for worker in self.idle:
+            worker.stdin.close()
+        self.idle.clear()
+
+def serve_worker():
+    pygame.display.init()
+    pygame.font.init()
+    get_font(74)
+    get_font(48)
+    line = sys.stdin.readline()
+    if not line:
+        return
+    job = json.loads(line)
+    filename = job['filename']
+    if job['source'] is not None:
+        fd, filename = tempfile.mkstemp(suffix='.pg')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(job['source'])
+    try:
+        PGGame(**job['options']).run(filename, job.get('script_dir'))
+    finally:
+        if job['source'] is not None:
+            os.unlink(filename)
+
+def compile_level(filename):
+    # moves the create lines at the top level of a script's init section into <name>.pgl and writes
+    # <name>_level.pg: the same script with those lines replaced by one 'level' command
+    with open(filename, 'r') as f:
+        lines = f.readlines()
+    base = os.path.splitext(filename)[0]
+    game = PGGame(title="Compile Level")
+    kept = []
+    level_at = None
+    in_init = True
+    for raw in lines:
+        line = raw.strip()
+        if line == 'every frame:' or game.parse_event_header(line):
+            in_init = False
+        words = line.split()
+        parts = [p.strip() for p in line.split(';') if p.strip()]
+        if in_init and not raw[:1].isspace() and parts and all(
+                p.split()[0].lower() == 'create' and len(p.split()) > 1 and re.search(r'at\s+([\d\.]+)\s*,\s*([\d\.]+)', p) for p in parts):
+            game.exec_cmd({}, line)
+            if level_at is None:
+                level_at = len(kept)
+                kept.append(None)
+            continue
+        if in_init and len(words) == 3 and words[0] == 'jump' and words[1] == 'power':
+            # sprites keep the jump power that was set when they were created
+            game.exec_cmd({}, line)
+        kept.append(raw)
+    if level_at is None:
+        print(f"{filename}: no create lines to compile")
+        return None
+    game.save_level(base + '.pgl')
+    kept[level_at] = 'level "%s"\n' % os.path.basename(base + '.pgl')
+    with open(base + '_level.pg', 'w') as f:
+        f.writelines(kept)
+    print(f"{base}.pgl: {len(game.platforms)} platforms, {len(game.sprites)} sprites; run {base}_level.pg")
+    return base + '_level.pg'
+
 class PGGame:
-    def __init__(self, width=800, height=600, world_width=2500, fps=60, title="PixelGame", embedded=False, tk_root=None):
+    def __init__(self, width=800, height=600, world_width=2500, fps=60, title="PixelGame", embedded=False, tk_root=None, compiled=True, render_scale=1,
+                 capture=None, capture_every=1, max_frames=0, rewind=0, adaptive=True):
         self.embedded = embedded
         self.tk_root = tk_root
-        pygame.init()
-        self.screen = pygame.display.set_mode((width, height))
+        self.compiled = compiled
+        self.capture = FrameCapture(capture, capture_every, fps) if capture else None
+        self.max_frames = max_frames
+        self.frame_count = 0
+        self.rewind = RewindBuffer(int(rewind * (fps or 60))) if rewind else None
+        self.checkpoint = None
+        # quality settings QualityGovernor turns down when frames run long; recordings keep full quality
+        self.particle_density = 1.0
+        self.draw_eyes = True
+        self.active_radius = None
+        self.base_render_scale = max(1, int(render_scale))
+        self.governor = QualityGovernor(fps) if adaptive and fps and not capture else None
+        self.text_cache = (None, None)
+        # not pygame.init(): that would also open the audio device, which only games with sound need
+        pygame.display.init()
+        pygame.font.init()
+        # display.init() doesn't start SDL's timer (pygame.init() would): until something like wait()
+        # does, get_ticks() stays 0 and 'wait', the scheduler and sound voice stealing stop working
+        pygame.time.wait(0)
+        # reuse the window of the previous game when it fits (the editor preview makes a game per edit)
+        self.screen = pygame.display.get_surface()
+        if self.screen is None or self.screen.get_size() != (width, height):
+            self.screen = pygame.display.set_mode((width, height))
+        self.set_render_scale(render_scale)
         pygame.display.set_caption(title)
         self.clock = pygame.time.Clock()
         self.fps = fps
         self.world_width = world_width
         self.sprites = {}
         self.platforms = []
+        self.platform_index = PlatformIndex()
+        self.sprite_grid = SpriteGrid()
         self.gravity = 0.5
         self.jump_power = -12.0
         self.bg_color = COLORS['skyblue']
@@ -40,8 +772,222 @@ class PGGame:
         self.paused_until = 0
         self.running = True
         self.eye_sprites = set()
-        self.font = pygame.font.Font(None, 74)
-        self.small_font = pygame.font.Font(None, 48)
+        self.particles = None
+        self.sounds = None
+        self.script_dir = '.'
+        self.on_press = {}
+        self.on_release = {}
+        self.on_touch = []
+        self.touch_active = set()
+        self.scheduler = Scheduler()
+        self.font = get_font(74)
+        self.small_font = get_font(48)
+
+    @property
+    def quality(self):
+        # 0 is full quality; see QualityGovernor.LEVELS
+        return self.governor.level if self.governor else 0
+
+    def set_quality(self, level):
+        # pin a level by hand; the governor carries on from there
+        level = max(0, min(level, len(QualityGovernor.LEVELS) - 1))
+        if self.governor:
+            self.governor.set(self, level, "set by hand")
+        else:
+            self.apply_quality(QualityGovernor.LEVELS[level][1])
+
+    def apply_quality(self, settings):
+        self.particle_density = settings['particle_density']
+        self.draw_eyes = settings['draw_eyes']
+        self.active_radius = settings['active_radius']
+        if self.render_scale != self.base_render_scale * settings['scale']:
+            self.set_render_scale(self.base_render_scale * settings['scale'])
+
+    def set_render_scale(self, scale):
+        # scale > 1 draws the world into a small canvas that is blown up to the window once per frame.
+        # world coordinates, the camera and collisions don't change; only draw() divides by the scale.
+        scale = max(1, int(scale))
+        self.render_scale = scale
+        if scale == 1:
+            self.canvas = self.screen
+        else:
+            w, h = self.screen.get_size()
+            self.canvas = pygame.Surface((w // scale, h // scale)).convert(self.screen)
+
+    def snapshot(self, full=False):
+        # platforms never move, so only their count is saved unless full=True; restoring a
+        # short snapshot drops platforms created after it and keeps the rest
+        now = pygame.time.get_ticks()
+        parts = [SNAP_HEAD.pack(b'PGS1', self.gravity, self.jump_power, self.camera_x, *self.bg_color[:3],
+                                max(0, self.paused_until - now), len(self.sprites), len(self.platforms), full)]
+        seen = {}
+        for i, (name, s) in enumerate(self.sprites.items()):
+            parts.append(pack_str(name))
+            if id(s) in seen:
+                parts.append(SNAP_SPRITE.pack(seen[id(s)], *([0.0] * 9), 0, 0, 0, 0))
+                continue
+            seen[id(s)] = i
+            flags = s.gravity | s.remove << 1 | s.collectable << 2 | s.enemy << 3 | s.on_ground << 4
+            parts.append(SNAP_SPRITE.pack(SNAP_NO_ALIAS, s.x, s.y, s.w, s.h, s.vx, s.vy, s.px, s.py,
+                                          s.jump_power, *s.color[:3], flags))
+        if full:
+            for p in self.platforms:
+                parts.append(SNAP_PLATFORM.pack(p.x, p.y, p.w, p.h, *p.color[:3]))
+        parts.append(struct.pack('<H', len(self.eye_sprites)))
+        parts.extend(pack_str(name) for name in sorted(self.eye_sprites))
+        if self.message:
+            msg, mx, my, msize, mcol = self.message
+            parts.append(b'\x01' + pack_str(msg) + SNAP_MESSAGE.pack(mx, my, msize, *mcol[:3]))
+        else:
+            parts.append(b'\x00')
+        return b''.join(parts)
+
+    def restore(self, data):
+        magic, gravity, jump_power, camera_x, r, g, b, paused, n_sprites, n_platforms, full = SNAP_HEAD.unpack_from(data)
+        if magic != b'PGS1':
+            raise ValueError("not a PixelGame snapshot")
+        off = SNAP_HEAD.size
+        self.gravity, self.jump_power, self.camera_x = gravity, jump_power, camera_x
+        self.bg_color = (r, g, b)
+        self.paused_until = pygame.time.get_ticks() + paused if paused else 0
+        # refill the existing dict so anything holding self.sprites (compiled scripts) stays valid
+        self.sprites.clear()
+        self.sprite_grid = SpriteGrid()
+        order = []
+        for _ in range(n_sprites):
+            name, off = unpack_str(data, off)
+            alias, x, y, w, h, vx, vy, px, py, jp, cr, cg, cb, flags = SNAP_SPRITE.unpack_from(data, off)
+            off += SNAP_SPRITE.size
+            if alias != SNAP_NO_ALIAS:
+                s = order[alias]
+            else:
+                s = Sprite(x, y, w, h, (cr, cg, cb), jp)
+                s.vx, s.vy, s.px, s.py = vx, vy, px, py
+                s.gravity, s.remove = bool(flags & 1), bool(flags & 2)
+                s.collectable, s.enemy, s.on_ground = bool(flags & 4), bool(flags & 8), bool(flags & 16)
+            order.append(s)
+            self.sprites[name] = s
+            self.sprite_grid.place(name, s)
+        if full:
+            self.platforms = []
+            for _ in range(n_platforms):
+                x, y, w, h, cr, cg, cb = SNAP_PLATFORM.unpack_from(data, off)
+                off += SNAP_PLATFORM.size
+                self.platforms.append(Platform(x, y, w, h, (cr, cg, cb)))
+            self.platform_index.dirty = True
+        elif len(self.platforms) > n_platforms:
+            del self.platforms[n_platforms:]
+            self.platform_index.dirty = True
+        n_eyes, = struct.unpack_from('<H', data, off)
+        off += 2
+        self.eye_sprites = set()
+        for _ in range(n_eyes):
+            name, off = unpack_str(data, off)
+            self.eye_sprites.add(name)
+        if data[off]:
+            msg, off = unpack_str(data, off + 1)
+            mx, my, msize, cr, cg, cb = SNAP_MESSAGE.unpack_from(data, off)
+            self.message = (msg, mx, my, msize, (cr, cg, cb))
+        else:
+            self.message = None
+        self.touch_active = set()
+
+    def step_back(self, frames=1):
+        if self.rewind is None:
+            return
+        for _ in range(frames):
+            snap = self.rewind.pop()
+        if snap:
+            self.restore(snap)
+
+    def restart(self):
+        # back to the state right after the init block, without running it again
+        if self.checkpoint:
+            self.restore(self.checkpoint)
+            if self.rewind is not None:
+                self.rewind = RewindBuffer(self.rewind.deltas.maxlen)
+
+    def save_level(self, path):
+        plats = self.platforms
+        order = sorted(range(len(plats)), key=lambda i: plats[i].rect.left)
+        names = [n for n, s in self.sprites.items() if not (n == 'player' and s is self.sprites.get('mario'))]
+        sprites = [self.sprites[n] for n in names]
+        encoded = [n.encode('utf-8') for n in names]
+        ends = []
+        end = 0
+        for b in encoded:
+            end += len(b)
+            ends.append(end)
+        head = LEVEL_HEAD.pack(b'PGL1', len(plats), len(sprites), end, max((p.rect.width for p in plats), default=0))
+        sections = [head,
+                    array('d', [v for p in plats for v in (p.x, p.y, p.w, p.h)]),
+                    array('i', [plats[i].rect.left for i in order]),
+                    array('I', order),
+                    bytes(c for p in plats for c in p.color[:3]),
+                    array('d', [v for s in sprites for v in (s.x, s.y, s.w, s.h)]),
+                    array('d', [s.jump_power for s in sprites]),
+                    bytes(c for s in sprites for c in s.color[:3]),
+                    bytes(s.gravity | s.collectable << 1 | s.enemy << 2 for s in sprites),
+                    array('I', ends),
+                    b''.join(encoded)]
+        with open(path, 'wb') as f:
+            f.write(b''.join(level_section(s) for s in sections))
+
+    def load_level(self, path):
+        # the arrays are read straight out of the mapped file; no per-object parsing
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, n_plat, n_spr, n_names, max_width = LEVEL_HEAD.unpack_from(data)
+            if magic != b'PGL1':
+                raise ValueError(f"{path} is not a level file")
+            off = LEVEL_HEAD.size + (-LEVEL_HEAD.size % 8)
+
+            def take(count, fmt):
+                nonlocal off
+                size = count * struct.calcsize(fmt)
+                a = array(fmt)
+                a.frombytes(data[off:off + size])
+                if sys.byteorder != 'little':
+                    a.byteswap()
+                off += size + (-size % 8)
+                return a
+
+            rects = iter(take(4 * n_plat, 'd'))
+            lefts = take(n_plat, 'i')
+            order = take(n_plat, 'I')
+            colors = iter(take(3 * n_plat, 'B'))
+            plats = [Platform(x, y, w, h, c) for (x, y, w, h), c in zip(zip(rects, rects, rects, rects), zip(colors, colors, colors))]
+            if not self.platforms and not self.platform_index.dirty:
+                # the file carries the sorted order, so the index doesn't need a rebuild
+                index = self.platform_index
+                index.items = [(i, plats[i]) for i in order]
+                index.lefts = lefts.tolist()
+                index.max_width = max_width
+            else:
+                self.platform_index.dirty = True
+            self.platforms.extend(plats)
+
+            rects = iter(take(4 * n_spr, 'd'))
+            jump_powers = take(n_spr, 'd')
+            colors = iter(take(3 * n_spr, 'B'))
+            flags = take(n_spr, 'B')
+            ends = take(n_spr, 'I')
+            names = data[off:off + n_names]
+        finally:
+            data.close()
+        start = 0
+        for (x, y, w, h), jump_power, c, flag, end in zip(zip(rects, rects, rects, rects), jump_powers, zip(colors, colors, colors), flags, ends):
+            # the offsets count bytes, so cut before decoding
+            name = names[start:end].decode('utf-8')
+            start = end
+            s = Sprite(x, y, w, h, c, jump_power)
+            s.gravity = bool(flag & 1)
+            s.collectable = bool(flag & 2)
+            s.enemy = bool(flag & 4)
+            self.sprites[name] = s
+            self.sprite_grid.discard(name)
+            self.sprite_grid.place(name, s)
 
     def parse_color(self, c):
         c = c.lower().strip().replace('#', '')
@@ -53,90 +999,216 @@ class PGGame:
 
     def create_sprite(self, name, x, y, w, h, color):
         col = self.parse_color(color)
-        s = {
-            'rect': pygame.Rect(x, y, w, h),
-            'vx': 0.0, 'vy': 0.0,
-            'color': col,
-            'jump_power': self.jump_power,
-            'gravity': True,
-            'remove': False
-        }
-        s['gravity'] = 'player' in name.lower() or 'mario' in name.lower() or 'bird' in name.lower() or 'goomba' in name.lower() or 'enemy' in name.lower()
+        s = Sprite(x, y, w, h, col, self.jump_power)
+        s.gravity = 'player' in name.lower() or 'mario' in name.lower() or 'bird' in name.lower() or 'goomba' in name.lower() or 'enemy' in name.lower()
         self.sprites[name] = s
+        self.sprite_grid.discard(name)
         if 'coin' in name.lower():
-            s['gravity'] = False
-            s['collectable'] = True
+            s.gravity = False
+            s.collectable = True
         if 'goomba' in name.lower() or 'enemy' in name.lower():
-            s['enemy'] = True
+            s.enemy = True
+        self.sprite_grid.place(name, s)
 
     def create_platform(self, x, y, w, h, color):
         col = self.parse_color(color)
-        self.platforms.append({'rect': pygame.Rect(x, y, w, h), 'color': col})
+        self.platforms.append(Platform(x, y, w, h, col))
+        self.platform_index.dirty = True
 
     def jump(self, name):
         s = self.sprites[name]
-        if s['vy'] >= 0:
-            s['vy'] = self.jump_power
+        if s.vy >= 0:
+            s.vy = self.jump_power
 
     def move_dir(self, name, dirr, speed):
         s = self.sprites[name]
         if dirr == 'right':
-            s['vx'] = speed
+            s.vx = speed
         elif dirr == 'left':
-            s['vx'] = -speed
+            s.vx = -speed
         elif dirr == 'up':
-            s['vy'] = -speed
+            s.vy = -speed
         elif dirr == 'down':
-            s['vy'] = speed
+            s.vy = speed
 
     def stop(self, name):
-        self.sprites[name]['vx'] = 0
+        self.sprites[name].vx = 0
 
     def set_message(self, msg, x, y, size, color):
         self.message = (msg, x, y, size, color)
 
-    def horizontal_collisions(self, rect, name):
-        s = self.sprites[name]
-        for p in self.platforms:
-            if rect.colliderect(p['rect']):
-                if s['vx'] > 0:
-                    rect.right = p['rect'].left
-                elif s['vx'] < 0:
-                    rect.left = p['rect'].right
-
-    def vertical_collisions(self, rect, name):
-        s = self.sprites[name]
-        on_ground = False
-        for p in self.platforms:
-            if rect.colliderect(p['rect']):
-                if s['vy'] > 0:
-                    rect.bottom = p['rect'].top
-                    on_ground = True
-                    s['vy'] = 0
-                elif s['vy'] < 0:
-                    rect.top = p['rect'].bottom
-                    s['vy'] = 0
-        return on_ground
+    def get_sounds(self):
+        if self.sounds is None:
+            try:
+                self.sounds = SoundBank()
+            except pygame.error as e:
+                print(f"No sound: {e}")
+                self.sounds = False
+        return self.sounds
+
+    def play_sound(self, key):
+        if self.sounds:
+            self.sounds.play(key)
+
+    def get_particles(self):
+        if self.particles is None:
+            if np is None:
+                # False, so the hint is printed once and not on every emit
+                print("particles need numpy: pip install numpy")
+                self.particles = False
+            else:
+                self.particles = ParticleSystem()
+        return self.particles
+
+    def parse_emit(self, sub_line):
+        # emit 30 at 100,200 color gold speed 4 life 0.5  /  emit 30 at coin ...
+        words = sub_line.split()
+        count = int(float(words[1]))
+        pos_match = re.search(r'at\s+(-?[\d\.]+)\s*,\s*(-?[\d\.]+)', sub_line)
+        if pos_match:
+            at = (float(pos_match.group(1)), float(pos_match.group(2)))
+        else:
+            at = words[words.index('at') + 1]
+        color = (255, 255, 255)
+        color_match = re.search(r'color\s+([\w#]+)', sub_line)
+        if color_match:
+            color = self.parse_color(color_match.group(1))
+        speed_match = re.search(r'speed\s+([\d\.]+)', sub_line)
+        life_match = re.search(r'life\s+([\d\.]+)', sub_line)
+        speed = float(speed_match.group(1)) if speed_match else 3.0
+        life = float(life_match.group(1)) if life_match else 1.0
+        return count, at, color, speed, life
+
+    def emit(self, count, at, color, speed, life):
+        ps = self.get_particles()
+        if not ps:
+            return
+        if isinstance(at, str):
+            s = self.sprites.get(at)
+            if s is None:
+                return
+            x, y = s.rect.center
+        else:
+            x, y = at
+        ps.emit(int(round(count * self.particle_density)), x, y, color, speed, life * (self.fps or 60))
+
+    def sweep(self, ax, ay, aw, ah, dx, dy, bx, by, bw, bh):
+        # time of impact of box a moving by (dx, dy) into a still box b: (t, nx, ny) or None
+        # t < 0 means the two already overlap; (nx, ny) is the contact normal facing the mover
+        if dx > 0:
+            tx_in, tx_out = (bx - ax - aw) / dx, (bx + bw - ax) / dx
+        elif dx < 0:
+            tx_in, tx_out = (bx + bw - ax) / dx, (bx - ax - aw) / dx
+        elif ax + aw <= bx or ax >= bx + bw:
+            return None
+        else:
+            tx_in, tx_out = -math.inf, math.inf
+        if dy > 0:
+            ty_in, ty_out = (by - ay - ah) / dy, (by + bh - ay) / dy
+        elif dy < 0:
+            ty_in, ty_out = (by + bh - ay) / dy, (by - ay - ah) / dy
+        elif ay + ah <= by or ay >= by + bh:
+            return None
+        else:
+            ty_in, ty_out = -math.inf, math.inf
+        t_in = max(tx_in, ty_in)
+        t_out = min(tx_out, ty_out)
+        if t_in >= t_out or t_out <= 0 or t_in > 1:
+            return None
+        if tx_in > ty_in:
+            return t_in, (-1 if dx > 0 else 1), 0
+        return t_in, 0, (-1 if dy > 0 else 1)
+
+    def move_and_collide(self, s):
+        s.px, s.py = s.x, s.y
+        s.contacts = []
+        s.on_ground = False
+        dx, dy = s.vx, s.vy
+        for _ in range(3):
+            if not dx and not dy:
+                break
+            reach = pygame.Rect(min(s.x, s.x + dx) - 1, min(s.y, s.y + dy) - 1, s.w + abs(dx) + 3, s.h + abs(dy) + 3)
+            hit = None
+            for p in self.platform_index.query(reach.left, reach.right):
+                if not reach.colliderect(p.rect):
+                    continue
+                h = self.sweep(s.x, s.y, s.w, s.h, dx, dy, p.x, p.y, p.w, p.h)
+                if h and (hit is None or h[0] < hit[0]):
+                    hit = h + (p,)
+            if hit is None:
+                s.x += dx
+                s.y += dy
+                break
+            t, nx, ny, p = hit
+            t = max(t, 0)
+            s.x += dx * t
+            s.y += dy * t
+            # land exactly on the face that was hit so rounding can't leave a gap or an overlap
+            if nx < 0: s.x = p.x - s.w
+            elif nx > 0: s.x = p.x + p.w
+            elif ny < 0: s.y = p.y - s.h
+            else: s.y = p.y + p.h
+            dx *= 1 - t
+            dy *= 1 - t
+            if nx:
+                dx = 0
+            if ny:
+                dy = 0
+                s.vy = 0
+                if ny < 0:
+                    s.on_ground = True
+            s.contacts.append((p, nx, ny))
+        s.sync_rect()
+
+    def touching(self, a, b):
+        # overlap now, or a contact somewhere along this frame's motion so fast sprites can't skip past each other.
+        # a pair that overlapped at the start of the frame and has moved apart since is not touching (t < 0):
+        # otherwise a bounce would fire again on the way out and reverse the sprite back in
+        s1 = self.sprites.get(a)
+        s2 = self.sprites.get(b)
+        if s1 is None or s2 is None:
+            return False
+        if s1.rect.colliderect(s2.rect):
+            return True
+        dx = (s1.x - s1.px) - (s2.x - s2.px)
+        dy = (s1.y - s1.py) - (s2.y - s2.py)
+        if not (dx or dy):
+            return False
+        hit = self.sweep(s1.px, s1.py, s1.w, s1.h, dx, dy, s2.px, s2.py, s2.w, s2.h)
+        return hit is not None and hit[0] >= 0
 
     def update_physics(self):
+        if self.platform_index.dirty:
+            self.platform_index.rebuild(self.platforms)
+        if self.active_radius is not None:
+            # lowered quality: sprites this far outside the view hold still until the camera comes near
+            margin = self.active_radius * self.screen.get_width()
+            near_lo = self.camera_x - margin
+            near_hi = self.camera_x + self.screen.get_width() + margin
         for name, s in list(self.sprites.items()):
-            if s['remove']:
+            if s.remove:
                 del self.sprites[name]
+                self.sprite_grid.discard(name)
+                continue
+            if s.frozen or self.active_radius is not None and (s.x + s.w < near_lo or s.x > near_hi):
+                s.px, s.py = s.x, s.y
                 continue
-            r = s['rect']
-            if s['gravity']:
-                s['vy'] += self.gravity
-            r.x += s['vx']
-            self.horizontal_collisions(r, name)
-            r.y += s['vy']
-            self.vertical_collisions(r, name)
-            s['rect'] = r
-
-            player_rect = self.sprites.get('player', {}).get('rect') or self.sprites.get('mario', {}).get('rect') or self.sprites.get('bird', {}).get('rect', pygame.Rect(0,0,0,0))
-            if player_rect and r.colliderect(player_rect) and name not in ('player', 'mario', 'bird'):
-                if s.get('collectable'):
-                    s['remove'] = True
-                elif s.get('enemy'):
+            if s.gravity:
+                s.vy += self.gravity
+            self.move_and_collide(s)
+            self.sprite_grid.place(name, s)
+
+        pname = next((n for n in ('player', 'mario', 'bird') if n in self.sprites), None)
+        if not pname:
+            return
+        player = self.sprites[pname]
+        for name, s in self.sprites.items():
+            if s is player or not (s.collectable or s.enemy):
+                continue
+            if self.touching(name, pname):
+                if s.collectable:
+                    s.remove = True
+                elif s.enemy:
                     self.set_message("GAME OVER!", 250, 250, 100, (255, 0, 0))
                     self.paused_until = pygame.time.get_ticks() + 3000
                     self.running = False
@@ -144,7 +1216,7 @@ class PGGame:
     def update_camera(self):
         pname = next((n for n in self.sprites if n in ('player', 'mario', 'bird')), None)
         if pname:
-            px = self.sprites[pname]['rect'].centerx
+            px = self.sprites[pname].rect.centerx
             target = px - self.screen.get_width() // 2
             self.camera_x = max(0, min(target, self.world_width - self.screen.get_width()))
 
@@ -213,28 +1285,60 @@ class PGGame:
                         self.set_message(msg, x, y, size, col)
             elif cmd == 'wait':
                 secs = float(words[1])
-                self.paused_until = pygame.time.get_ticks() + int(secs * 1000)
+                rest = [w for w in words[2:] if w not in ('second', 'seconds')]
+                if rest:
+                    # wait 2 mario: only that sprite stops, the rest of the game keeps going
+                    s = self.sprites[rest[0]]
+                    s.frozen += 1
+                    self.scheduler.add(int(secs * 1000), thaw(s))
+                else:
+                    self.paused_until = pygame.time.get_ticks() + int(secs * 1000)
             elif cmd == 'quit':
                 self.running = False
+            elif cmd == 'restart':
+                self.restart()
+            elif cmd == 'emit':
+                self.emit(*self.parse_emit(sub_line))
+            elif cmd == 'sound' and words[1] == 'load':
+                # sound load jump "sounds/jump.wav" - paths are relative to the script
+                path = sub_line.split(None, 3)[3].strip().strip('"')
+                if self.get_sounds():
+                    self.sounds.load(words[2], os.path.join(self.script_dir, path))
+            elif cmd == 'sound' and words[1] == 'channels':
+                if self.get_sounds():
+                    self.sounds.set_channels(int(words[2]))
+            elif cmd == 'play':
+                self.play_sound(words[1])
+            elif cmd == 'level':
+                # level "castle.pgl" - made by --compile-level; paths are relative to the script
+                path = sub_line.split(None, 1)[1].strip().strip('"')
+                self.load_level(os.path.join(self.script_dir, path))
+            elif cmd == 'particles' and np is not None:
+                if words[1] == 'max':
+                    self.particles = ParticleSystem(int(words[2]), self.particles.size if self.particles else 2)
+                elif words[1] == 'size' and self.get_particles():
+                    self.particles.size = max(1, int(words[2]))
             elif cmd == 'draw' and words[1] == 'eyes' and words[2] == 'on':
                 self.eye_sprites.add(words[3])
             elif cmd == 'set':
                 prop = words[1]
                 name = words[2]
                 value = float(words[-1])
-                r = self.sprites[name]['rect']
+                s = self.sprites[name]
                 if prop == 'x':
-                    r.x = value
+                    s.x = s.px = value
                 elif prop == 'y':
-                    r.y = value
+                    s.y = s.py = value
+                s.sync_rect()
+                self.sprite_grid.place(name, s)
             elif cmd == 'reverse':
                 prop = words[1]
                 name = words[2]
                 s = self.sprites[name]
                 if prop == 'x':
-                    s['vx'] = -s['vx']
+                    s.vx = -s.vx
                 elif prop == 'y':
-                    s['vy'] = -s['vy']
+                    s.vy = -s.vy
 
     def eval_cond(self, keys, cond):
         cond = cond.strip().lower()
@@ -253,15 +1357,13 @@ class PGGame:
             if len(parts) == 2:
                 s1 = parts[0].strip()
                 s2 = parts[1].strip()
-                r1 = self.sprites.get(s1, {}).get('rect', pygame.Rect(0,0,0,0))
-                r2 = self.sprites.get(s2, {}).get('rect', pygame.Rect(0,0,0,0))
-                return r1.colliderect(r2)
+                return self.touching(s1, s2)
         match = re.match(r'^(\w+)\s+(x|y)\s+([><=])\s+(\d+(?:\.\d+)?)$', cond)
         if match:
             sname, prop, op, valstr = match.groups()
             val = float(valstr)
-            s = self.sprites.get(sname, {})
-            r = s.get('rect', pygame.Rect(0,0,0,0))
+            s = self.sprites.get(sname)
+            r = s.rect if s is not None else pygame.Rect(0,0,0,0)
             pos = r.x if prop == 'x' else r.y
             if op == '>': return pos > val
             if op == '<': return pos < val
@@ -275,11 +1377,29 @@ class PGGame:
             elif stmt['type'] == 'if':
                 if self.eval_cond(keys, stmt['cond']):
                     self.exec_block(stmt['block'], keys)
+            elif stmt['type'] == 'after':
+                self.scheduler.add(stmt['delay'], lambda game, keys, block=stmt['block']: game.run_block(block, keys))
+
+    def parse_event_header(self, line):
+        # 'on key space:', 'on release left:', 'when mario touches goomba:', 'every 0.5 seconds:'
+        # -> (kind, trigger, inline body)
+        m = re.match(r'^on\s+(key|release)\s+(\w+)\s*:(.*)$', line, re.IGNORECASE)
+        if m:
+            kind = 'press' if m.group(1).lower() == 'key' else 'release'
+            return kind, KEY_MAP.get(m.group(2).lower()), m.group(3).strip()
+        m = re.match(r'^when\s+(\w+)\s+touches\s+(\w+)\s*:(.*)$', line, re.IGNORECASE)
+        if m:
+            return 'touch', (m.group(1), m.group(2)), m.group(3).strip()
+        m = re.match(r'^every\s+(\d+(?:\.\d+)?)\s*(?:seconds?)?\s*:(.*)$', line, re.IGNORECASE)
+        if m:
+            return 'timer', max(1, int(float(m.group(1)) * 1000)), m.group(2).strip()
+        return None
 
     def parse_program(self, lines):
         i = 0
         init_block = []
         frame_block = []
+        handlers = {'press': {}, 'release': {}, 'touch': [], 'timer': []}
         block_stack = [init_block]
         indent_stack = [0]
         current_block = init_block
@@ -290,18 +1410,39 @@ class PGGame:
                 i += 1
                 continue
             indent = len(raw_line) - len(raw_line.lstrip())
-            while indent < indent_stack[-1]:
-                indent_stack.pop()
-                block_stack.pop()
-            current_block = block_stack[-1]
-            if indent > indent_stack[-1]:
-                indent_stack.append(indent)
             if line == 'every frame:':
                 current_block = frame_block
                 block_stack = [frame_block]
                 indent_stack = [indent]
                 i += 1
                 continue
+            event = self.parse_event_header(line)
+            if event:
+                kind, trigger, inline = event
+                if kind == 'touch':
+                    handler_block = []
+                    handlers['touch'].append((trigger[0], trigger[1], handler_block))
+                elif kind == 'timer':
+                    handler_block = []
+                    handlers['timer'].append((trigger, handler_block))
+                else:
+                    handler_block = handlers[kind].setdefault(trigger, [])
+                if inline:
+                    handler_block.append({'type': 'cmd', 'line': inline})
+                else:
+                    current_block = handler_block
+                    block_stack = [handler_block]
+                    indent_stack = [indent]
+                i += 1
+                continue
+            while indent < indent_stack[-1]:
+                indent_stack.pop()
+                # a section's own body indent has no block of its own to close
+                if len(block_stack) > 1:
+                    block_stack.pop()
+            current_block = block_stack[-1]
+            if indent > indent_stack[-1]:
+                indent_stack.append(indent)
             if line.endswith(':') and line.startswith('if '):
                 cond = line[3:-1].strip()
                 sub_block = []
@@ -309,43 +1450,255 @@ class PGGame:
                 block_stack.append(sub_block)
                 i += 1
                 continue
+            m = re.match(r'^after\s+(\d+(?:\.\d+)?)\s*(?:seconds?)?\s*:(.*)$', line, re.IGNORECASE)
+            if m:
+                sub_block = []
+                current_block.append({'type': 'after', 'delay': int(float(m.group(1)) * 1000), 'block': sub_block})
+                if m.group(2).strip():
+                    sub_block.append({'type': 'cmd', 'line': m.group(2).strip()})
+                else:
+                    block_stack.append(sub_block)
+                i += 1
+                continue
             current_block.append({'type': 'cmd', 'line': line})
             i += 1
-        return init_block, frame_block
+        return init_block, frame_block, handlers
 
     def run_block(self, block, keys={}):
         self.exec_block(block, keys)
 
+    def compile_cond(self, cond):
+        # mirrors eval_cond, but produces a python expression
+        cond = cond.strip().lower()
+        if cond.startswith('not '):
+            return 'not (%s)' % self.compile_cond(cond[4:])
+        if ' or ' in cond:
+            return ' or '.join('(%s)' % self.compile_cond(part.strip()) for part in cond.split(' or '))
+        if cond.startswith('key '):
+            kname = cond[4:].strip()
+            return 'keys[%d]' % KEY_MAP.get(kname, 0)
+        if ' touches ' in cond:
+            parts = cond.split(' touches ')
+            if len(parts) == 2:
+                return 'game.touching(%r, %r)' % (parts[0].strip(), parts[1].strip())
+        match = re.match(r'^(\w+)\s+(x|y)\s+([><=])\s+(\d+(?:\.\d+)?)$', cond)
+        if match:
+            sname, prop, op, valstr = match.groups()
+            op = '==' if op == '=' else op
+            return "(S[%r].rect.%s if %r in S else 0) %s %r" % (sname, prop, sname, op, float(valstr))
+        return 'False'
+
+    def compile_cmd(self, sub_line):
+        # the hot per-frame commands become direct attribute code, the rest go through exec_cmd
+        words = sub_line.split()
+        cmd = words[0].lower()
+        if cmd == 'move':
+            speed = 5.0
+            if len(words) > 3 and words[3] == 'speed':
+                speed = float(words[4])
+            field, sign = {'right': ('vx', 1), 'left': ('vx', -1), 'down': ('vy', 1), 'up': ('vy', -1)}.get(words[1], (None, 0))
+            if not field:
+                return ['S[%r]' % words[2]]
+            return ["S[%r].%s = %r" % (words[2], field, sign * speed)]
+        if cmd == 'stop':
+            return ["S[%r].vx = 0" % words[1]]
+        if cmd == 'jump' and len(words) == 2:
+            return ["_s = S[%r]" % words[1],
+                    "if _s.vy >= 0: _s.vy = game.jump_power"]
+        if cmd == 'reverse' and words[1] in ('x', 'y'):
+            field = 'v' + words[1]
+            return ["_s = S[%r]" % words[2], "_s.%s = -_s.%s" % (field, field)]
+        if cmd == 'set' and words[1] in ('x', 'y'):
+            axis = words[1]
+            return ["_s = S[%r]" % words[2],
+                    "_s.%s = _s.p%s = %r" % (axis, axis, float(words[-1])),
+                    "_s.sync_rect()",
+                    "game.sprite_grid.place(%r, _s)" % words[2]]
+        if cmd == 'quit':
+            return ['game.running = False']
+        if cmd == 'emit':
+            return ['game.emit(*%r)' % (self.parse_emit(sub_line),)]
+        if cmd == 'play':
+            return ['game.play_sound(%r)' % words[1]]
+        return ['game.exec_cmd(keys, %r)' % sub_line]
+
+    def compile_block(self, block, stmts, depth=1):
+        pad = '    ' * depth
+        out = []
+        for stmt in block:
+            if stmt['type'] == 'cmd':
+                for sub_line in stmt['line'].split(';'):
+                    sub_line = sub_line.strip()
+                    if not sub_line: continue
+                    try:
+                        code = self.compile_cmd(sub_line)
+                    except (IndexError, ValueError):
+                        code = ['game.exec_cmd(keys, %r)' % sub_line]
+                    out.extend(pad + c for c in code)
+            elif stmt['type'] == 'if':
+                out.append(pad + 'if %s:' % self.compile_cond(stmt['cond']))
+                out.extend(self.compile_block(stmt['block'], stmts, depth + 1) or [pad + '    pass'])
+            else:
+                stmts.append(stmt)
+                out.append(pad + 'game.exec_block([STMTS[%d]], keys)' % (len(stmts) - 1))
+        return out
+
+    def transpile(self, blocks, source_name):
+        # blocks: {function name: block}; every function takes (game, keys)
+        stmts = []
+        out = ['# generated by pg_interpreter.py from %s - do not edit' % source_name, '']
+        for fname, block in blocks.items():
+            out.append('def %s(game, keys):' % fname)
+            out.append('    S = game.sprites')
+            out.extend(self.compile_block(block, stmts))
+            out.append('')
+        return '\n'.join(out) + '\n', stmts
+
+    def collect_stmts(self, block, stmts):
+        # same walk as compile_block, so STMTS indexes match a cached module
+        for stmt in block:
+            if stmt['type'] == 'if':
+                self.collect_stmts(stmt['block'], stmts)
+            elif stmt['type'] != 'cmd':
+                stmts.append(stmt)
+        return stmts
+
+    def load_compiled(self, filename, lines, blocks):
+        digest = hashlib.sha1(('%d\n' % TRANSPILE_VERSION + ''.join(lines)).encode('utf-8')).hexdigest()[:16]
+        script_dir = os.path.dirname(os.path.abspath(filename))
+        temp_dir = os.path.abspath(tempfile.gettempdir())
+        if os.path.commonpath([script_dir, temp_dir]) == temp_dir:
+            # temp copies (editor preview, worker source jobs) compile in memory: the shared temp dir
+            # is no place for code that gets run, and every edit would leave another file there
+            code, stmts = self.transpile(blocks, os.path.basename(filename))
+            module = types.ModuleType('pg_compiled_' + digest)
+            module.STMTS = stmts
+            exec(compile(code, filename, 'exec'), module.__dict__)
+            return module
+        cache_dir = os.path.join(script_dir, '__pgcache__')
+        path = os.path.join(cache_dir, 'pg_%s.py' % digest)
+        if os.path.exists(path):
+            stmts = []
+            for block in blocks.values():
+                self.collect_stmts(block, stmts)
+        else:
+            code, stmts = self.transpile(blocks, os.path.basename(filename))
+            os.makedirs(cache_dir, exist_ok=True)
+            # written aside and renamed, so a crash or a second game never leaves a half-written module
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                f.write(code)
+            os.replace(tmp_path, path)
+        spec = importlib.util.spec_from_file_location('pg_compiled_' + digest, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        module.STMTS = stmts
+        return module
+
     def draw(self):
-        self.screen.fill(self.bg_color)
-        cam_x = self.camera_x
-        for p in self.platforms:
-            px = p['rect'].x - cam_x
-            if px + p['rect'].width > 0 and px < self.screen.get_width():
-                pygame.draw.rect(self.screen, p['color'], (int(px), int(p['rect'].y), int(p['rect'].width), int(p['rect'].height)))
-        for name, s in self.sprites.items():
-            if s['remove']: continue
-            px = s['rect'].x - cam_x
-            if px + s['rect'].width > 0 and px < self.screen.get_width():
-                pygame.draw.rect(self.screen, s['color'], (int(px), int(s['rect'].y), int(s['rect'].width), int(s['rect'].height)))
-                if name in self.eye_sprites:
-                    ex1 = s['rect'].centerx - 8 - cam_x
-                    ey1 = s['rect'].centery - 5
-                    ex2 = s['rect'].centerx + 8 - cam_x
-                    pygame.draw.circle(self.screen, (0,0,0), (int(ex1), int(ey1)), 4)
-                    pygame.draw.circle(self.screen, (0,0,0), (int(ex2), int(ey1)), 4)
+        canvas = self.canvas
+        sc = self.render_scale
+        canvas.fill(self.bg_color)
+        cam_x = int(self.camera_x)
+        view_right = cam_x + self.screen.get_width()
+        if self.platform_index.dirty:
+            self.platform_index.rebuild(self.platforms)
+        # edges are scaled separately so neighbouring blocks stay seamless at any scale
+        for p in self.platform_index.query(cam_x, view_right):
+            r = p.rect
+            x0, y0 = (r.left - cam_x) // sc, r.top // sc
+            pygame.draw.rect(canvas, p.color, (x0, y0, (r.right - cam_x) // sc - x0, r.bottom // sc - y0))
+        eye_r = max(1, 4 // sc)
+        for name, s in self.sprite_grid.query(cam_x, view_right):
+            if s.remove: continue
+            r = s.rect
+            x0, y0 = (r.left - cam_x) // sc, r.top // sc
+            pygame.draw.rect(canvas, s.color, (x0, y0, (r.right - cam_x) // sc - x0, r.bottom // sc - y0))
+            if self.draw_eyes and name in self.eye_sprites:
+                ex1 = (r.centerx - 8 - cam_x) // sc
+                ey1 = (r.centery - 5) // sc
+                ex2 = (r.centerx + 8 - cam_x) // sc
+                pygame.draw.circle(canvas, (0,0,0), (ex1, ey1), eye_r)
+                pygame.draw.circle(canvas, (0,0,0), (ex2, ey1), eye_r)
+        if self.particles:
+            self.particles.draw(canvas, cam_x, sc)
+        if canvas is not self.screen:
+            pygame.transform.scale(canvas, self.screen.get_size(), self.screen)
+        # text goes on after the upscale so it stays sharp
         if self.message:
             msg, mx, my, msize, mcol = self.message
-            font = self.font if msize > 60 else self.small_font
-            text_surf = font.render(msg, True, mcol)
-            self.screen.blit(text_surf, (mx, my))
+            # rendered again only when the message changes
+            if self.text_cache[0] != self.message:
+                font = self.font if msize > 60 else self.small_font
+                self.text_cache = (self.message, font.render(msg, True, mcol))
+            self.screen.blit(self.text_cache[1], (mx, my))
         pygame.display.flip()
+        self.frame_count += 1
+        if self.capture:
+            self.capture.offer(self.screen)
+        self.frame_done()
 
-    def run(self, filename):
+    def read_keys(self):
+        # hook: where run() gets the held keys each frame (pg_net merges in a remote player's keys)
+        return pygame.key.get_pressed()
+
+    def frame_done(self):
+        # hook: called after every drawn frame
+        pass
+
+    def dispatch_events(self, events, keys):
+        for event in events:
+            if event.type == pygame.KEYDOWN and event.key in self.on_press:
+                self.on_press[event.key](self, keys)
+            elif event.type == pygame.KEYUP and event.key in self.on_release:
+                self.on_release[event.key](self, keys)
+
+    def dispatch_touches(self, keys):
+        # handlers fire once when a contact starts, not on every frame it lasts
+        for i, (a, b, fn) in enumerate(self.on_touch):
+            if b == 'platform':
+                s = self.sprites.get(a)
+                hit = s is not None and bool(s.contacts)
+            else:
+                hit = self.touching(a, b)
+            if not hit:
+                self.touch_active.discard(i)
+            elif i not in self.touch_active:
+                self.touch_active.add(i)
+                fn(self, keys)
+
+    def run(self, filename, script_dir=None):
+        # script_dir: where 'sound load' and 'level' paths start, when filename is a temp copy of the script
         with open(filename, 'r') as f:
             lines = f.readlines()
+        self.script_dir = script_dir or os.path.dirname(os.path.abspath(filename))
+
+        init_block, frame_block, handlers = self.parse_program(lines)
 
-        init_block, frame_block = self.parse_program(lines)
+        blocks = {'frame': frame_block}
+        for code, block in handlers['press'].items():
+            blocks['press_%s' % code] = block
+        for code, block in handlers['release'].items():
+            blocks['release_%s' % code] = block
+        for i, (a, b, block) in enumerate(handlers['touch']):
+            blocks['touch_%d' % i] = block
+        for i, (interval, block) in enumerate(handlers['timer']):
+            blocks['timer_%d' % i] = block
+        module = None
+        if self.compiled:
+            try:
+                module = self.load_compiled(filename, lines, blocks)
+            except Exception:
+                print(traceback.format_exc())
+        fns = {}
+        for fname, block in blocks.items():
+            fns[fname] = getattr(module, fname) if module else (lambda game, keys, block=block: game.run_block(block, keys))
+        frame_fn = fns['frame']
+        self.on_press = {code: fns['press_%s' % code] for code in handlers['press']}
+        self.on_release = {code: fns['release_%s' % code] for code in handlers['release']}
+        self.on_touch = [(a, b, fns['touch_%d' % i]) for i, (a, b, block) in enumerate(handlers['touch'])]
+        for i, (interval, block) in enumerate(handlers['timer']):
+            self.scheduler.add(interval, fns['timer_%d' % i], interval)
 
         if 'mario' in self.sprites:
             self.sprites['player'] = self.sprites['mario']
@@ -355,16 +1708,29 @@ class PGGame:
         except Exception:
             print(traceback.format_exc())
             self.running = False
+        # platforms never move and restore() trims the ones created later, so a short snapshot does
+        self.checkpoint = self.snapshot()
 
         self.running = True
-        while self.running:
-            for event in pygame.event.get():
+        while self.running and not (self.max_frames and self.frame_count >= self.max_frames):
+            frame_start = time.perf_counter()
+            events = pygame.event.get()
+            for event in events:
                 if event.type == pygame.QUIT:
                     self.running = False
 
-            keys = pygame.key.get_pressed()
+            keys = self.read_keys()
             now = pygame.time.get_ticks()
 
+            if self.rewind is not None and keys[pygame.K_BACKSPACE]:
+                self.step_back()
+                self.update_camera()
+                self.draw()
+                self.clock.tick(self.fps)
+                if self.embedded:
+                    self.tk_root.update()
+                continue
+
             if self.paused_until > now:
                 self.draw()
                 self.clock.tick(self.fps)
@@ -373,30 +1739,70 @@ class PGGame:
                 continue
 
             try:
-                self.run_block(frame_block, keys)
+                self.dispatch_events(events, keys)
+                frame_fn(self, keys)
+                self.scheduler.advance(self.clock.get_time(), self, keys)
                 self.update_physics()
+                if self.particles:
+                    self.particles.update(self.gravity)
+                self.dispatch_touches(keys)
                 self.update_camera()
+                if self.rewind is not None:
+                    self.rewind.push(self.snapshot())
             except Exception:
                 print(traceback.format_exc())
                 self.running = False
 
             self.draw()
+            if self.governor:
+                self.governor.frame(self, time.perf_counter() - frame_start)
             self.clock.tick(self.fps)
             if self.embedded:
                 self.tk_root.update()
 
+        if self.capture:
+            self.capture.close()
         if not self.embedded:
+            FONTS.clear()
             pygame.quit()
-            sys.exit()
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python pg_interpreter.py yourgame.pg")
-        sys.exit(1)
-    filename = sys.argv[1]
-    if not os.path.exists(filename):
-        print(f"File {filename} not found!")
-        sys.exit(1)
-    title = os.path.splitext(os.path.basename(filename))[0].replace('_', ' ').title()
-    game = PGGame(title=title)
-    game.run(filename)
\ No newline at end of file
+    parser = argparse.ArgumentParser(usage="python pg_interpreter.py yourgame.pg [more.pg ...]")
+    parser.add_argument('filenames', nargs='*')
+    parser.add_argument('--interpret', action='store_true', help="run the script with the interpreter instead of the transpiled python")
+    parser.add_argument('--scale', type=int, default=1, help="draw at 1/SCALE resolution and upscale, e.g. 4 for chunky pixel art")
+    parser.add_argument('--capture', help="record to a .gif file or a folder of PNG frames; with several games, a folder that gets one capture per game")
+    parser.add_argument('--capture-every', type=int, default=1, help="keep every Nth frame")
+    parser.add_argument('--frames', type=int, default=0, help="stop after this many frames")
+    parser.add_argument('--headless', action='store_true', help="run without a window, e.g. to batch-record previews")
+    parser.add_argument('--fixed-quality', action='store_true', help="never lower particles, eyes or resolution to keep up the frame rate")
+    parser.add_argument('--worker', action='store_true', help="start up and wait for a game on stdin (used by WorkerPool)")
+    parser.add_argument('--compile-level', action='store_true', help="move the game's create lines into a binary .pgl level that loads in milliseconds")
+    args = parser.parse_args()
+    if args.worker:
+        serve_worker()
+        sys.exit()
+    if not args.filenames:
+        parser.error("no game given")
+    if args.compile_level:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        for filename in args.filenames:
+            compile_level(filename)
+        sys.exit()
+    if args.headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    for filename in args.filenames:
+        if not os.path.exists(filename):
+            print(f"File {filename} not found!")
+            sys.exit(1)
+    for filename in args.filenames:
+        base = os.path.splitext(os.path.basename(filename))[0]
+        title = base.replace('_', ' ').title()
+        capture = args.capture
+        if capture and len(args.filenames) > 1:
+            capture = os.path.join(capture, base + '.gif')
+        game = PGGame(title=title, compiled=not args.interpret, render_scale=args.scale,
+                      capture=capture, capture_every=args.capture_every, max_frames=args.frames,
+                      adaptive=not args.fixed_quality)
+        game.run(filename)
+    sys.exit()
\ No newline at end of file
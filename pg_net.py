@@ -0,0 +1,505 @@
+# pg_net.py - two players, two computers: one hosts the game, the other joins over the LAN
+# Host:     python pg_net.py host pong.pg
+# Join:     python pg_net.py join 192.168.1.20
+# Loopback: python pg_net.py loopback game.pg --frames 600 --sprites 300   (both ends on this machine, prints stats)
+#           use a game that keeps running: the bundled samples' one-line 'if ...: text ... ; quit' ends them on frame 1
+#
+# The host runs the game. The client only draws: it sends its held keys over UDP every frame and
+# gets back the sprites that changed since the last state it confirmed. Platforms, background and
+# the rest of the world go once over TCP when the client connects.
+
+import os
+import sys
+import time
+import socket
+import struct
+import zlib
+import argparse
+import subprocess
+import tempfile
+
+from pg_interpreter import PGGame, Sprite, KEY_MAP, pack_str, unpack_str
+import pygame
+
+DEFAULT_PORT = 5055
+KEY_CODES = [KEY_MAP[k] for k in sorted(KEY_MAP)]
+
+# client -> host: input seq, newest state seq the client has, held key bits, client clock (ms)
+INPUT = struct.Struct('<4sIIHd')
+# host -> client: state seq, base seq (NO_BASE = keyframe), echoed client clock, camera x,
+# flags, background, number of changed and removed sprites
+STATE_HEAD = struct.Struct('<4sIIdfB3BHH')
+NO_BASE = 0xFFFFFFFF
+POS_SCALE = 8   # positions go over the wire in 1/8 pixel steps
+KEEP_STATES = 64
+
+F_ZLIB = 1
+F_MESSAGE = 2
+
+R_NAME = 1
+R_POS_DELTA = 2
+R_POS_ABS = 4
+R_SIZE = 8
+R_COLOR = 16
+R_EYES = 32
+
+def key_bits(keys):
+    bits = 0
+    for i, code in enumerate(KEY_CODES):
+        if keys[code]:
+            bits |= 1 << i
+    return bits
+
+def send_blob(sock, data):
+    sock.sendall(struct.pack('<I', len(data)) + data)
+
+class MergedKeys:
+    # the host's own keys plus the ones the remote player holds
+    def __init__(self, local, remote):
+        self.local = local
+        self.remote = remote
+
+    def __getitem__(self, code):
+        return self.local[code] or code in self.remote
+
+def encode_record(i, rec, old):
+    qx, qy, w, h, color, name, eyes = rec
+    mask = 0
+    parts = []
+    if old is None:
+        mask |= R_NAME | R_SIZE | R_COLOR
+        parts.append(pack_str(name))
+    if old is None or (qx, qy) != old[:2]:
+        dx, dy = (qx - old[0], qy - old[1]) if old else (None, None)
+        if old and -32768 <= dx < 32768 and -32768 <= dy < 32768:
+            mask |= R_POS_DELTA
+            parts.append(struct.pack('<hh', dx, dy))
+        else:
+            mask |= R_POS_ABS
+            parts.append(struct.pack('<ii', qx, qy))
+    if old is not None and (w, h) != old[2:4]:
+        mask |= R_SIZE
+    if mask & R_SIZE:
+        parts.append(struct.pack('<ff', w, h))
+    if old is not None and color != old[4]:
+        mask |= R_COLOR
+    if mask & R_COLOR:
+        parts.append(bytes(color))
+    if eyes:
+        mask |= R_EYES
+    if old is not None and mask == (R_EYES if eyes else 0) and eyes == old[6]:
+        return None
+    return struct.pack('<HB', i, mask) + b''.join(parts)
+
+def decode_state(data, states):
+    # -> (seq, echo, camera_x, bg, message or False when unchanged, {id: record}) or None
+    # when the delta base is no longer known here
+    magic, seq, base, echo, camera_x, flags, r, g, b, n_changed, n_removed = STATE_HEAD.unpack_from(data)
+    if magic != b'PGS2':
+        return None
+    body = data[STATE_HEAD.size:]
+    if flags & F_ZLIB:
+        body = zlib.decompress(body)
+    if base == NO_BASE:
+        state = {}
+    elif base in states:
+        state = dict(states[base])
+    else:
+        return None
+    off = 0
+    message = False
+    if flags & F_MESSAGE:
+        if body[off]:
+            msg, off = unpack_str(body, off + 1)
+            mx, my, msize, cr, cg, cb = struct.unpack_from('<fffBBB', body, off)
+            off += 15
+            message = (msg, mx, my, msize, (cr, cg, cb))
+        else:
+            message = None
+            off += 1
+    for _ in range(n_removed):
+        i, = struct.unpack_from('<H', body, off)
+        off += 2
+        state.pop(i, None)
+    for _ in range(n_changed):
+        i, mask = struct.unpack_from('<HB', body, off)
+        off += 3
+        old = state.get(i)
+        if mask & R_NAME:
+            name, off = unpack_str(body, off)
+        else:
+            name = old[5]
+        qx, qy = old[:2] if old else (0, 0)
+        if mask & R_POS_DELTA:
+            dx, dy = struct.unpack_from('<hh', body, off)
+            qx, qy = qx + dx, qy + dy
+            off += 4
+        elif mask & R_POS_ABS:
+            qx, qy = struct.unpack_from('<ii', body, off)
+            off += 8
+        w, h = old[2:4] if old else (0.0, 0.0)
+        if mask & R_SIZE:
+            w, h = struct.unpack_from('<ff', body, off)
+            off += 8
+        color = old[4] if old else (0, 0, 0)
+        if mask & R_COLOR:
+            color = tuple(body[off:off + 3])
+            off += 3
+        state[i] = (qx, qy, w, h, color, name, bool(mask & R_EYES))
+    return seq, echo, camera_x, (r, g, b), message, state
+
+class NetHost(PGGame):
+    def __init__(self, port=DEFAULT_PORT, **kwargs):
+        PGGame.__init__(self, **kwargs)
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('', port))
+        self.listener.listen(1)
+        self.listener.setblocking(False)
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind(('', port))
+        self.udp.setblocking(False)
+        self.peer = None
+        self.peer_addr = None
+        self.remote = set()
+        self.input_seq = 0
+        self.echo = 0.0
+        self.seq = 0
+        self.acked = None
+        self.sent = {}
+        self.ids = {}
+        self.last_message = None
+        self.platforms_sent = -1
+        self.bytes_sent = 0
+        self.frames_sent = 0
+
+    def read_keys(self):
+        keys = PGGame.read_keys(self)
+        self.poll_network()
+        return MergedKeys(keys, self.remote)
+
+    def poll_network(self):
+        if self.peer is None:
+            try:
+                self.peer, addr = self.listener.accept()
+                self.peer.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                print(f"Player 2 joined from {addr[0]}")
+                self.platforms_sent = -1
+            except BlockingIOError:
+                pass
+        while True:
+            try:
+                data, addr = self.udp.recvfrom(64)
+            except (BlockingIOError, ConnectionResetError):
+                break
+            if len(data) != INPUT.size:
+                continue
+            magic, seq, ack, bits, sent_at = INPUT.unpack(data)
+            if magic != b'PGI1' or seq <= self.input_seq:
+                continue
+            self.input_seq = seq
+            self.peer_addr = addr
+            self.echo = sent_at
+            if ack in self.sent and (self.acked is None or ack > self.acked):
+                self.acked = ack
+            held = {code for i, code in enumerate(KEY_CODES) if bits & (1 << i)}
+            # 'on key' / 'on release' handlers on the host see the remote player's presses too
+            for code in held - self.remote:
+                pygame.event.post(pygame.event.Event(pygame.KEYDOWN, key=code))
+            for code in self.remote - held:
+                pygame.event.post(pygame.event.Event(pygame.KEYUP, key=code))
+            self.remote = held
+
+    def frame_done(self):
+        if self.peer is None:
+            return
+        if self.platforms_sent != len(self.platforms):
+            # platforms only go over TCP, whole, when the client joins or one gets created
+            try:
+                self.peer.setblocking(True)
+                send_blob(self.peer, zlib.compress(self.snapshot(full=True)))
+            except OSError as e:
+                print(f"Player 2 left ({e})")
+                self.drop_peer()
+                return
+            self.platforms_sent = len(self.platforms)
+            self.acked = None
+            self.sent.clear()
+        if self.peer_addr is None:
+            return
+        self.seq += 1
+        state = self.capture_state()
+        packet = self.encode_state(state)
+        self.sent[self.seq] = (state, self.message)
+        self.sent.pop(self.seq - KEEP_STATES, None)
+        try:
+            self.udp.sendto(packet, self.peer_addr)
+            self.bytes_sent += len(packet)
+            self.frames_sent += 1
+        except OSError:
+            pass
+
+    def drop_peer(self):
+        # back to waiting for a client; a new one numbers its input from 1 again
+        self.peer.close()
+        self.peer = None
+        self.peer_addr = None
+        for code in self.remote:
+            pygame.event.post(pygame.event.Event(pygame.KEYUP, key=code))
+        self.remote = set()
+        self.input_seq = 0
+        self.acked = None
+        self.sent.clear()
+
+    def capture_state(self):
+        state = {}
+        for name, s in self.sprites.items():
+            if s.remove:
+                continue
+            i = self.ids.setdefault(name, len(self.ids))
+            state[i] = (round(s.x * POS_SCALE), round(s.y * POS_SCALE), s.w, s.h, tuple(s.color[:3]), name, name in self.eye_sprites)
+        return state
+
+    def encode_state(self, state):
+        base, base_message = self.sent.get(self.acked, ({}, None)) if self.acked is not None else ({}, None)
+        base_seq = self.acked if self.acked in self.sent else NO_BASE
+        if base_seq == NO_BASE:
+            base, base_message = {}, None
+        changed = []
+        for i, rec in state.items():
+            r = encode_record(i, rec, base.get(i))
+            if r is not None:
+                changed.append(r)
+        removed = [struct.pack('<H', i) for i in base if i not in state]
+        flags = 0
+        body = []
+        if base_seq == NO_BASE or self.message != base_message:
+            flags |= F_MESSAGE
+            if self.message:
+                msg, mx, my, msize, mcol = self.message
+                body.append(b'\x01' + pack_str(msg) + struct.pack('<fffBBB', mx, my, msize, *mcol[:3]))
+            else:
+                body.append(b'\x00')
+        body = b''.join(body + removed + changed)
+        packed = zlib.compress(body, 1)
+        if len(packed) < len(body):
+            body = packed
+            flags |= F_ZLIB
+        head = STATE_HEAD.pack(b'PGS2', self.seq, base_seq, self.echo, self.camera_x, flags,
+                               *self.bg_color[:3], len(changed), len(removed))
+        return head + body
+
+    def run(self, filename):
+        try:
+            PGGame.run(self, filename)
+        finally:
+            if self.frames_sent:
+                print(f"Host: sent {self.frames_sent} states, {self.bytes_sent / self.frames_sent:.0f} bytes/frame")
+            if self.peer:
+                self.peer.close()
+            self.udp.close()
+            self.listener.close()
+
+class NetClient:
+    def __init__(self, host, port=DEFAULT_PORT, fps=60, title="PixelGame", **kwargs):
+        self.game = PGGame(title=title + " (joined)", fps=fps, compiled=False, **kwargs)
+        self.tcp = socket.create_connection((host, port), timeout=10)
+        self.tcp.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.tcp_buf = b''
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.connect((host, port))
+        self.udp.setblocking(False)
+        self.states = {}
+        self.latest = 0
+        self.seq = 0
+        self.bytes_received = 0
+        self.states_applied = 0
+        self.latencies = []
+        self.last_packet = time.perf_counter()
+        self.world = False
+
+    def poll_world(self):
+        # length-prefixed zlib snapshots from the host; the socket stays non-blocking after the first
+        self.tcp.setblocking(self.world is False)
+        try:
+            chunk = self.tcp.recv(1 << 16)
+        except (BlockingIOError, socket.timeout):
+            return
+        if not chunk:
+            raise ConnectionError("host closed the connection")
+        self.tcp_buf += chunk
+        while len(self.tcp_buf) >= 4:
+            n, = struct.unpack_from('<I', self.tcp_buf)
+            if len(self.tcp_buf) < 4 + n:
+                break
+            self.game.restore(zlib.decompress(self.tcp_buf[4:4 + n]))
+            self.tcp_buf = self.tcp_buf[4 + n:]
+            self.states.clear()
+            self.latest = 0
+            self.world = True
+
+    def poll_states(self):
+        newest = None
+        while True:
+            try:
+                data = self.udp.recv(1 << 16)
+            except (BlockingIOError, ConnectionRefusedError):
+                break
+            self.bytes_received += len(data)
+            self.last_packet = time.perf_counter()
+            decoded = decode_state(data, self.states)
+            if decoded is None or decoded[0] <= self.latest:
+                continue
+            seq = decoded[0]
+            self.states[seq] = decoded[5]
+            self.states.pop(seq - KEEP_STATES, None)
+            self.latest = seq
+            newest = decoded
+        if newest:
+            self.apply(newest)
+
+    def apply(self, decoded):
+        seq, echo, camera_x, bg, message, state = decoded
+        game = self.game
+        game.camera_x = camera_x
+        game.bg_color = bg
+        if message is not False:
+            game.message = message
+        names = set()
+        for qx, qy, w, h, color, name, eyes in state.values():
+            names.add(name)
+            s = game.sprites.get(name)
+            if s is None:
+                s = game.sprites[name] = Sprite(0, 0, w, h, color, 0)
+            s.x, s.y, s.w, s.h, s.color = qx / POS_SCALE, qy / POS_SCALE, w, h, color
+            s.rect.size = (w, h)
+            s.sync_rect()
+            game.sprite_grid.place(name, s)
+            if eyes:
+                game.eye_sprites.add(name)
+            else:
+                game.eye_sprites.discard(name)
+        for name in [n for n in game.sprites if n not in names]:
+            del game.sprites[name]
+            game.sprite_grid.discard(name)
+        self.states_applied += 1
+        if echo:
+            self.latencies.append(time.perf_counter() * 1000 - echo)
+
+    def run(self, frames=0, keys_fn=None, timeout=3.0):
+        game = self.game
+        game.running = True
+        frame = 0
+        while game.running and not (frames and frame >= frames):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    game.running = False
+            keys = keys_fn(frame) if keys_fn else pygame.key.get_pressed()
+            self.seq += 1
+            self.udp.send(INPUT.pack(b'PGI1', self.seq, self.latest, key_bits(keys), time.perf_counter() * 1000))
+            self.poll_world()
+            self.poll_states()
+            if time.perf_counter() - self.last_packet > timeout:
+                print("Host stopped sending")
+                break
+            game.draw()
+            game.clock.tick(game.fps)
+            frame += 1
+        self.tcp.close()
+        self.udp.close()
+
+    def report(self):
+        lat = sorted(self.latencies)
+        if not lat:
+            print("Client: no states received")
+            return
+        print(f"Client: {self.states_applied} states shown, {self.bytes_received / max(1, self.states_applied):.0f} bytes/frame received, "
+              f"input-to-display latency {sum(lat) / len(lat):.1f} ms avg, {lat[int(len(lat) * 0.95)]:.1f} ms p95")
+
+class PressedKeys:
+    def __init__(self, held):
+        self.held = held
+
+    def __getitem__(self, code):
+        return code in self.held
+
+def stress_script(filename, sprites):
+    # the game plus N walking sprites, so every one of them changes every frame. 'crowd' is not a name
+    # the interpreter gives gravity or enemy/coin handling, so they can't end the game or fall off it
+    lines = [f"create crowd_{i} at {40 + (i * 37) % 2000},{(i * 53) % 400} size 12 color #{(i * 2654435761) & 0xFFFFFF:06x}\n"
+             for i in range(sprites)]
+    moves = [f"move right crowd_{i} speed {1 + i % 4}\n" for i in range(sprites)]
+    with open(filename) as f:
+        body = f.readlines()
+    fd, path = tempfile.mkstemp(suffix='.pg')
+    with os.fdopen(fd, 'w') as f:
+        f.writelines(lines + moves + body)
+    return path
+
+def loopback(filename, frames, sprites, port, fps):
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    script = stress_script(filename, sprites) if sprites else filename
+    host = subprocess.Popen([sys.executable, os.path.abspath(__file__), 'host', script, '--headless',
+                             '--port', str(port), '--frames', str(frames + fps * 3), '--fps', str(fps)])
+    try:
+        client = None
+        for _ in range(50):
+            if host.poll() is not None:
+                break
+            try:
+                client = NetClient('127.0.0.1', port, fps=fps)
+                break
+            except OSError:
+                time.sleep(0.1)
+        if client is None:
+            if host.poll() is not None:
+                print(f"The host exited with code {host.returncode} before the client could join")
+            else:
+                print("Could not reach the host")
+            return
+        # hold 'up' and 'down' in turns so the host always has fresh input to echo
+        up, down = KEY_MAP['up'], KEY_MAP['down']
+        try:
+            client.run(frames, keys_fn=lambda f: PressedKeys({up} if f % 60 < 30 else {down}))
+        except ConnectionError as e:
+            print(f"Lost the host: {e}")
+            try:
+                host.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                pass
+        if host.poll() is not None:
+            # the game ended itself (quit, game over) before the measured frames were done
+            print(f"The host exited with code {host.returncode} during the run; the numbers cover less than {frames} frames")
+        client.report()
+    finally:
+        host.terminate()
+        host.wait()
+        if script != filename:
+            os.unlink(script)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(usage="python pg_net.py host game.pg | join HOST | loopback game.pg")
+    parser.add_argument('mode', choices=['host', 'join', 'loopback'])
+    parser.add_argument('target', help="the .pg script (host, loopback) or the host's address (join)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--fps', type=int, default=60)
+    parser.add_argument('--frames', type=int, default=0, help="stop after this many frames")
+    parser.add_argument('--headless', action='store_true')
+    parser.add_argument('--sprites', type=int, default=0, help="loopback: add this many moving sprites")
+    args = parser.parse_args()
+    if args.headless:
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    if args.mode == 'host':
+        if not os.path.exists(args.target):
+            print(f"File {args.target} not found!")
+            sys.exit(1)
+        title = os.path.splitext(os.path.basename(args.target))[0].replace('_', ' ').title()
+        print(f"Hosting {title} on port {args.port}")
+        NetHost(port=args.port, title=title, fps=args.fps, max_frames=args.frames).run(args.target)
+    elif args.mode == 'join':
+        client = NetClient(args.target, args.port, fps=args.fps)
+        client.run(args.frames)
+        client.report()
+    else:
+        loopback(args.target, args.frames or 600, args.sprites, args.port, args.fps)
+    pygame.quit()
@@ -1,13 +1,64 @@
 import tkinter as tk
 from tkinter import filedialog, ttk
 import os
-import subprocess
 import platform
 import tempfile
 import sys
 import io
 import re
-from pg_interpreter import PGGame
+import threading
+import queue
+from pg_interpreter import PGGame, WorkerPool, check_line
+
+class ScriptChecker(threading.Thread):
+    # checks the script off the Tk thread. check_line results are kept per line text, so after a
+    # keystroke only the edited line is parsed again; the rest is set work on the cached results.
+    # results come back through a queue that the editor polls (Tk calls must stay on the Tk thread).
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.lines = {}
+        self.start()
+
+    def submit(self, tab, content):
+        self.jobs.put((tab, content))
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            # only the newest buffer matters
+            while not self.jobs.empty():
+                job = self.jobs.get()
+            tab, content = job
+            self.results.put((tab,) + self.check(content))
+
+    def check(self, content):
+        lines = content.split('\n')
+        if len(self.lines) > 4 * len(lines) + 1000:
+            self.lines = {raw: self.lines[raw] for raw in lines if raw in self.lines}
+        results = []
+        for raw in lines:
+            result = self.lines.get(raw)
+            if result is None:
+                result = self.lines[raw] = check_line(raw)
+            results.append(result)
+        created = {name for defines, uses, errors in results for name in defines}
+        if 'mario' in created:
+            created.add('player')
+        # None: the script loads a level file, whose sprite names aren't known here
+        check_names = None not in created
+        problems = []
+        for lineno, (defines, uses, errors) in enumerate(results, 1):
+            for start, end, message in errors:
+                problems.append((lineno, start, end, 'error', message))
+            for name, start, end in uses:
+                if check_names and name not in created:
+                    problems.append((lineno, start, end, 'unknown', f"no sprite named '{name}'"))
+        # what the game actually gets: comments, blank lines and spacing inside a line don't count
+        program = tuple((len(raw) - len(raw.lstrip()), ' '.join(raw.split())) for raw in lines
+                        if raw.strip() and not raw.strip().startswith('#'))
+        return problems, program
 
 class PixelEditor:
     def __init__(self):
@@ -31,6 +82,11 @@ class PixelEditor:
         self.editmenu.add_command(label="Redo", command=self.redo)
         self.menubar.add_cascade(label="Edit", menu=self.editmenu)
         
+        self.previewmenu = tk.Menu(self.menubar, tearoff=0)
+        self.previewmenu.add_command(label="Rewind 1 Second", command=self.rewind_preview)
+        self.previewmenu.add_command(label="Restart", command=self.restart_preview)
+        self.menubar.add_cascade(label="Preview", menu=self.previewmenu)
+        
         self.root.config(menu=self.menubar)
         
         self.root.columnconfigure(0, weight=2)
@@ -39,6 +95,8 @@ class PixelEditor:
         self.root.rowconfigure(1, weight=1)
         
         tk.Label(self.root, text="Code Editor").grid(row=0, column=0, sticky='w')
+        self.problems_label = tk.Label(self.root, fg='red', anchor='w')
+        self.problems_label.grid(row=2, column=0, sticky='ew')
         
         self.notebook = ttk.Notebook(self.root)
         self.notebook.grid(row=1, column=0, sticky='nsew')
@@ -66,9 +124,14 @@ class PixelEditor:
         self.debug_stream = None
         self.old_stdout = None
         self.old_stderr = None
+        # a pygame process kept warm for Run, so the game window opens without the startup wait
+        self.pool = WorkerPool()
+        self.checker = ScriptChecker()
+        self.poll_checker()
         
         self.new_file()
         self.root.mainloop()
+        self.pool.close()
 
     def get_current_text(self):
         if not self.notebook.tabs():
@@ -89,11 +152,13 @@ class PixelEditor:
     def new_file(self):
         text = tk.Text(self.notebook, width=50, height=40, undo=True)
         tab_id = self.notebook.add(text, text="untitled.pg")
-        self.tabs[tab_id] = {'text': text, 'file': None, 'tmp': None, 'preview_scheduled': None, 'highlight_scheduled': None}
+        self.tabs[tab_id] = {'text': text, 'file': None, 'tmp': None, 'check_scheduled': None, 'highlight_scheduled': None, 'program': None, 'problems': []}
         text.tag_configure('keyword', foreground='blue')
         text.tag_configure('number', foreground='orange')
         text.tag_configure('string', foreground='red')
         text.tag_configure('comment', foreground='gray')
+        text.tag_configure('error', underline=True, foreground='red')
+        text.tag_configure('unknown', underline=True, background='#fff0c0')
         text.bind('<KeyRelease>', self.on_modify)
         self.notebook.select(tab_id)
         self.highlight_text(text)
@@ -106,15 +171,17 @@ class PixelEditor:
             text = tk.Text(self.notebook, width=50, height=40, undo=True)
             text.insert(tk.END, content)
             tab_id = self.notebook.add(text, text=os.path.basename(file))
-            self.tabs[tab_id] = {'text': text, 'file': file, 'tmp': None, 'preview_scheduled': None, 'highlight_scheduled': None}
+            self.tabs[tab_id] = {'text': text, 'file': file, 'tmp': None, 'check_scheduled': None, 'highlight_scheduled': None, 'program': None, 'problems': []}
             text.tag_configure('keyword', foreground='blue')
             text.tag_configure('number', foreground='orange')
             text.tag_configure('string', foreground='red')
             text.tag_configure('comment', foreground='gray')
+            text.tag_configure('error', underline=True, foreground='red')
+            text.tag_configure('unknown', underline=True, background='#fff0c0')
             text.bind('<KeyRelease>', self.on_modify)
             self.notebook.select(tab_id)
             self.highlight_text(text)
-            self.auto_preview()
+            self.check_script()
 
     def save(self):
         filename = self.get_current_file()
@@ -150,7 +217,11 @@ class PixelEditor:
     def on_tab_change(self, event):
         self.stop_preview()
         self.debugger.delete('1.0', tk.END)
-        self.auto_preview()
+        current_tab = self.notebook.select()
+        if current_tab in self.tabs:
+            self.tabs[current_tab]['program'] = None
+            self.show_problems(current_tab)
+        self.check_script()
 
     def on_modify(self, event=None):
         text = self.get_current_text()
@@ -161,16 +232,57 @@ class PixelEditor:
             self.root.after_cancel(self.tabs[current_tab]['highlight_scheduled'])
         self.tabs[current_tab]['highlight_scheduled'] = self.root.after(300, lambda t=text: self.highlight_text(t))
         
-        if self.tabs[current_tab]['preview_scheduled']:
-            self.root.after_cancel(self.tabs[current_tab]['preview_scheduled'])
-        self.tabs[current_tab]['preview_scheduled'] = self.root.after(1000, self.auto_preview)
+        if self.tabs[current_tab]['check_scheduled']:
+            self.root.after_cancel(self.tabs[current_tab]['check_scheduled'])
+        self.tabs[current_tab]['check_scheduled'] = self.root.after(150, self.check_script)
+
+    def check_script(self):
+        text = self.get_current_text()
+        if text:
+            current_tab = self.notebook.select()
+            self.tabs[current_tab]['check_scheduled'] = None
+            self.checker.submit(current_tab, text.get('1.0', 'end-1c'))
+
+    def poll_checker(self):
+        try:
+            while True:
+                tab, problems, program = self.checker.results.get_nowait()
+                if tab not in self.tabs:
+                    continue
+                text = self.tabs[tab]['text']
+                text.tag_remove('error', '1.0', tk.END)
+                text.tag_remove('unknown', '1.0', tk.END)
+                for lineno, start, end, kind, message in problems:
+                    text.tag_add(kind, f"{lineno}.{start}", f"{lineno}.{end}")
+                self.tabs[tab]['problems'] = problems
+                self.show_problems(tab)
+                # restart the preview only when the game itself changed, and keep the last good one
+                # running while the script has errors. the first check after loading or switching tabs
+                # starts it either way: the problems are listed, and most scripts still run
+                errors = any(kind == 'error' for lineno, start, end, kind, message in problems)
+                first = self.tabs[tab]['program'] is None
+                if (first or not errors) and program != self.tabs[tab]['program'] and tab == self.notebook.select():
+                    self.tabs[tab]['program'] = program
+                    self.root.after_idle(self.auto_preview)
+        except queue.Empty:
+            pass
+        self.root.after(50, self.poll_checker)
+
+    def show_problems(self, tab):
+        problems = self.tabs[tab]['problems']
+        if not problems:
+            self.problems_label.config(text="")
+            return
+        lineno, start, end, kind, message = problems[0]
+        more = f"  (+{len(problems) - 1} more)" if len(problems) > 1 else ""
+        self.problems_label.config(text=f"Line {lineno}: {message}{more}")
 
     def highlight_text(self, text_widget):
         content = text_widget.get("1.0", tk.END)
         for tag in ['keyword', 'number', 'string', 'comment']:
             text_widget.tag_remove(tag, "1.0", tk.END)
         
-        keyword_pattern = r'\b(create|platform|sprite|at|size|width|height|color|move|left|right|up|down|speed|stop|jump|power|background|gravity|on|off|text|wait|quit|draw|eyes|on|set|x|y|reverse|if|every|frame|touches|key|or|not)\b'
+        keyword_pattern = r'\b(create|platform|sprite|at|size|width|height|color|move|left|right|up|down|speed|stop|jump|power|background|gravity|on|off|text|wait|quit|draw|eyes|on|set|x|y|reverse|if|every|frame|touches|key|or|not|release|when|emit|particles|life|max|sound|load|play|channels|restart|after|seconds|level)\b'
         for match in re.finditer(keyword_pattern, content, re.IGNORECASE):
             start = f"1.0 + {match.start()} chars"
             end = f"1.0 + {match.end()} chars"
@@ -210,7 +322,7 @@ class PixelEditor:
         os.environ['SDL_WINDOWID'] = str(self.embed.winfo_id())
         
         title = os.path.splitext(os.path.basename(self.get_current_file() or 'untitled'))[0].replace('_', ' ').title()
-        self.game = PGGame(title=title, embedded=True, tk_root=self.root)
+        self.game = PGGame(title=title, embedded=True, tk_root=self.root, rewind=10)
         
         self.old_stdout = sys.stdout
         self.old_stderr = sys.stderr
@@ -219,11 +331,17 @@ class PixelEditor:
         sys.stderr = self.debug_stream
         self.update_debugger()
         
-        self.game.run(tmp_filename)
+        filename = self.get_current_file()
+        game = self.game
+        game.run(tmp_filename, os.path.dirname(os.path.abspath(filename)) if filename else None)
         
         sys.stdout = self.old_stdout
         sys.stderr = self.old_stderr
-        self.game = None
+        if self.game is game:
+            # the game ended by itself: the next check starts it again, even if the program is unchanged
+            self.game = None
+            if current_tab in self.tabs:
+                self.tabs[current_tab]['program'] = None
 
     def update_debugger(self):
         if self.debug_stream:
@@ -236,6 +354,18 @@ class PixelEditor:
         if self.game and self.game.running:
             self._after_id = self.root.after(500, self.update_debugger)
 
+    def rewind_preview(self):
+        # also: hold Backspace in the preview
+        if self.game:
+            self.game.step_back(self.game.fps)
+
+    def restart_preview(self):
+        if self.game:
+            self.game.restart()
+        else:
+            # the preview game has ended (quit, game over): run the script again
+            self.auto_preview()
+
     def stop_preview(self):
         if self._after_id:
             self.root.after_cancel(self._after_id)
@@ -255,7 +385,8 @@ class PixelEditor:
         self.save()
         filename = self.get_current_file()
         if filename:
-            subprocess.Popen(['python', 'pg_interpreter.py', filename])
+            title = os.path.splitext(os.path.basename(filename))[0].replace('_', ' ').title()
+            self.pool.run(filename, title=title)
 
 if __name__ == "__main__":
     PixelEditor()
\ No newline at end of file
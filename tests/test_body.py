@@ -0,0 +1,11 @@
+import pytest
+
+from pg_interpreter import Sprite
+
+
+@pytest.mark.parametrize('x, y', [(10.7, 20.2), (-0.5, -1.5), (2.5, 3.5), (-2.25, 0.0)])
+def test_rect_is_the_same_before_and_after_sync(x, y):
+    s = Sprite(x, y, 10, 10, (255, 0, 0), -12)
+    created = s.rect.topleft
+    s.sync_rect()
+    assert s.rect.topleft == created
@@ -0,0 +1,20 @@
+import pygame
+import pytest
+
+from pg_interpreter import FrameCapture
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def test_gif_capture_stops_at_max_gif_frames(tmp_path):
+    path = str(tmp_path / 'run.gif')
+    capture = FrameCapture(path, max_gif_frames=5)
+    surface = pygame.Surface((16, 16))
+    for i in range(12):
+        surface.fill((i * 20, 0, 0))
+        capture.offer(surface)
+    capture.close()
+    assert capture.saved == 5
+    assert capture.dropped == 7
+    with Image.open(path) as gif:
+        assert gif.n_frames == 5
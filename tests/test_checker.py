@@ -0,0 +1,12 @@
+from pg_interpreter import check_line
+
+
+def test_when_touches_platform_uses_only_the_sprite():
+    defines, uses, errors = check_line('when mario touches platform:')
+    assert errors == []
+    assert [name for name, start, end in uses] == ['mario']
+
+
+def test_when_touches_sprite_uses_both_names():
+    defines, uses, errors = check_line('when mario touches goomba:')
+    assert [name for name, start, end in uses] == ['mario', 'goomba']
@@ -0,0 +1,39 @@
+import os
+import tempfile
+
+from pg_interpreter import PGGame
+
+SCRIPT = 'create ball at 100,100 size 10 color red\ngravity off\nmove right ball speed 5\n'
+
+
+def test_same_script_under_two_names_shares_one_cache_file(tmp_path, monkeypatch):
+    # pytest's tmp_path lives in the temp dir, which is never cached
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path / 'elsewhere'))
+    positions = []
+    for name in ('first.pg', 'second.pg'):
+        script = tmp_path / name
+        script.write_text(SCRIPT)
+        game = PGGame(fps=0, max_frames=10, adaptive=False)
+        game.run(str(script))
+        positions.append((game.sprites['ball'].x, game.sprites['ball'].y))
+    cached = [n for n in os.listdir(tmp_path / '__pgcache__') if n.endswith('.py')]
+    assert len(cached) == 1 and cached[0].startswith('pg_')
+    assert positions[0] == positions[1] == (150, 100)
+
+
+def test_scripts_in_the_temp_dir_compile_without_a_disk_cache(tmp_path):
+    script = tmp_path / 'preview.pg'
+    script.write_text(SCRIPT)
+    game = PGGame(fps=0, max_frames=10, adaptive=False)
+    game.run(str(script))
+    assert game.sprites['ball'].x == 150
+    assert not (tmp_path / '__pgcache__').exists()
+
+
+def test_cache_hit_rebuilds_the_same_statement_table():
+    game = PGGame(fps=0, max_frames=1, adaptive=False)
+    lines = ['every frame:\n', '    after 1 second: move down ball speed 5\n',
+             '    if ball x > 10:\n', '        after 2 seconds: quit\n']
+    init_block, frame_block, handlers = game.parse_program(lines)
+    code, stmts = game.transpile({'frame': frame_block}, 'walk.pg')
+    assert len(stmts) == 2 and game.collect_stmts(frame_block, []) == stmts
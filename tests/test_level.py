@@ -0,0 +1,30 @@
+from pg_interpreter import PGGame
+
+
+def test_level_round_trip_keeps_non_ascii_names(tmp_path):
+    game = PGGame(adaptive=False)
+    game.exec_cmd({}, 'create café at 10,20 size 30 color gold')
+    game.exec_cmd({}, 'create mario at 40,50 size 40 color red')
+    game.exec_cmd({}, 'create platform at 0,500 width 800 height 20 color gray')
+    path = str(tmp_path / 'level.pgl')
+    game.save_level(path)
+
+    loaded = PGGame(adaptive=False)
+    loaded.load_level(path)
+    assert list(loaded.sprites) == ['café', 'mario']
+    assert loaded.sprites['mario'].rect.topleft == (40, 50)
+    assert len(loaded.platforms) == 1
+
+
+def test_level_command_in_a_temp_copy_loads_from_script_dir(tmp_path):
+    project = tmp_path / 'project'
+    project.mkdir()
+    game = PGGame(adaptive=False)
+    game.exec_cmd({}, 'create mario at 40,50 size 40 color red')
+    game.save_level(str(project / 'castle.pgl'))
+
+    copy = tmp_path / 'preview.pg'
+    copy.write_text('level "castle.pgl"\n')
+    loaded = PGGame(fps=0, max_frames=1, adaptive=False)
+    loaded.run(str(copy), str(project))
+    assert loaded.sprites['mario'].rect.left == 40
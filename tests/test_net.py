@@ -0,0 +1,28 @@
+import socket
+import struct
+import time
+
+from pg_net import NetHost
+
+
+def test_host_survives_a_client_that_disconnects(capsys):
+    host = NetHost(port=0, adaptive=False)
+    port = host.listener.getsockname()[1]
+    client = socket.create_connection(('127.0.0.1', port))
+    for _ in range(50):
+        host.poll_network()
+        if host.peer is not None:
+            break
+        time.sleep(0.01)
+    host.frame_done()
+    # close with a reset, so the next send fails at once
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+    client.close()
+    time.sleep(0.05)
+    host.exec_cmd({}, 'create platform at 0,500 width 800 height 20 color gray')
+    host.frame_done()
+    host.frame_done()
+    assert host.peer is None
+    assert "Player 2 left" in capsys.readouterr().out
+    host.listener.close()
+    host.udp.close()
@@ -0,0 +1,11 @@
+import pg_interpreter
+from pg_interpreter import PGGame
+
+
+def test_missing_numpy_hint_is_printed_once(monkeypatch, capsys):
+    monkeypatch.setattr(pg_interpreter, 'np', None)
+    game = PGGame(adaptive=False)
+    for _ in range(3):
+        game.emit(10, (100, 100), (255, 0, 0), 4, 0.5)
+    assert capsys.readouterr().out.count("particles need numpy") == 1
+    assert game.particles is False
@@ -0,0 +1,12 @@
+from pg_interpreter import PGGame, QualityGovernor
+
+
+def test_set_quality_without_governor_clamps_the_level():
+    game = PGGame(adaptive=False)
+    game.set_quality(99)
+    lowest = QualityGovernor.LEVELS[-1][1]
+    assert game.particle_density == lowest['particle_density']
+    assert game.draw_eyes == lowest['draw_eyes']
+    game.set_quality(-3)
+    assert game.particle_density == QualityGovernor.LEVELS[0][1]['particle_density']
+    assert game.render_scale == game.base_render_scale
@@ -0,0 +1,26 @@
+from pg_interpreter import PGGame
+
+
+def test_step_back_returns_to_earlier_position(tmp_path):
+    script = tmp_path / 'walk.pg'
+    script.write_text('create ball at 100,100 size 10 color red\ngravity off\nmove right ball speed 5\n')
+    game = PGGame(fps=0, max_frames=10, rewind=2, adaptive=False)
+    game.run(str(script))
+    ball = game.sprites['ball']
+    assert ball.x == 150
+    assert len(game.rewind) == 9
+
+    game.step_back(4)
+    assert game.sprites['ball'].x == 130
+
+
+def test_restart_drops_platforms_created_after_the_init_block(tmp_path):
+    script = tmp_path / 'build.pg'
+    script.write_text('create ball at 100,100 size 10 color red\ncreate platform at 0,500 width 800 height 20 color gray\n'
+                      'gravity off\nmove right ball speed 5\n')
+    game = PGGame(fps=0, max_frames=5, adaptive=False)
+    game.run(str(script))
+    game.exec_cmd({}, 'create platform at 0,300 width 100 height 20 color gray')
+    game.restart()
+    assert game.sprites['ball'].x == 100
+    assert [(p.x, p.y) for p in game.platforms] == [(0, 500)]
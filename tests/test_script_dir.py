@@ -0,0 +1,20 @@
+import wave
+
+from pg_interpreter import PGGame
+
+
+def test_sound_paths_start_at_script_dir_for_temp_copies(tmp_path):
+    project = tmp_path / 'project'
+    (project / 'sounds').mkdir(parents=True)
+    with wave.open(str(project / 'sounds' / 'jump.wav'), 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(22050)
+        w.writeframes(b'\0\0' * 100)
+    copy = tmp_path / 'preview.pg'
+    copy.write_text('sound load jump "sounds/jump.wav"\n')
+    game = PGGame(fps=0, max_frames=1, adaptive=False)
+    game.run(str(copy), str(project))
+    if not game.sounds:  # no audio device here
+        return
+    assert 'jump' in game.sounds.sounds
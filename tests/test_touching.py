@@ -0,0 +1,32 @@
+import pytest
+
+from pg_interpreter import PGGame
+
+BOUNCE = '''create ball at 120,290 size 20 color white
+create p1 at 50,250 width 20 height 100 color red
+gravity off
+move left ball speed 7
+
+every frame:
+    if ball touches p1:
+        reverse x ball
+'''
+
+
+@pytest.mark.parametrize('compiled', [True, False])
+def test_ball_bounces_off_the_paddle_and_leaves(tmp_path, compiled):
+    script = tmp_path / 'bounce.pg'
+    script.write_text(BOUNCE)
+    game = PGGame(fps=0, max_frames=30, adaptive=False, compiled=compiled)
+    game.run(str(script))
+    assert game.sprites['ball'].x > 120
+
+
+def test_fast_ball_touches_a_thin_wall_it_passes_in_one_frame(tmp_path):
+    script = tmp_path / 'wall.pg'
+    script.write_text(BOUNCE.replace('width 20', 'width 4').replace('speed 7', 'speed 45')
+                      .replace('reverse x ball', 'text "HIT" at 10,10'))
+    game = PGGame(fps=0, max_frames=3, adaptive=False)
+    game.run(str(script))
+    assert game.sprites['ball'].x + 20 < 50
+    assert game.message is not None and game.message[0] == 'HIT'